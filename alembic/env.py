@@ -7,7 +7,7 @@ import sys
 # Add /app to Python path
 sys.path.append('/app')
 
-from database import Base
+from models import Base
 
 load_dotenv()
 
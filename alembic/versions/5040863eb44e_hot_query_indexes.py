@@ -0,0 +1,52 @@
+"""Indexes for the hot query shapes and a player_status enum
+
+Revision ID: 5040863eb44e
+Revises: b56a27cf0d88
+Create Date: 2026-10-18 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "5040863eb44e"
+down_revision = "b56a27cf0d88"
+branch_labels = None
+depends_on = None
+
+player_status = sa.Enum('joined', 'declined', name='player_status')
+
+def upgrade():
+    # The primary keys are already indexed, these only slowed down writes
+    op.drop_index('ix_users_id', table_name='users')
+    op.drop_index('ix_game_id', table_name='game')
+    op.drop_index('ix_player_games_id', table_name='player_games')
+
+    # admin_view_games: games of one group, paginated by id
+    op.create_index('ix_game_group_id_id', 'game', ['group_id', 'id'])
+    # show_active_games: only a small fraction of games is active
+    op.create_index('ix_game_active', 'game', ['id'], postgresql_where=sa.text('is_active'))
+    # ON DELETE CASCADE from users and per-player history
+    op.create_index('ix_player_games_player_id', 'player_games', ['player_id'])
+
+    player_status.create(op.get_bind())
+    op.alter_column(
+        'player_games', 'status',
+        type_=player_status,
+        postgresql_using='status::player_status',
+    )
+
+def downgrade():
+    op.alter_column(
+        'player_games', 'status',
+        type_=sa.String,
+        postgresql_using='status::text',
+    )
+    player_status.drop(op.get_bind())
+
+    op.drop_index('ix_player_games_player_id', table_name='player_games')
+    op.drop_index('ix_game_active', table_name='game')
+    op.drop_index('ix_game_group_id_id', table_name='game')
+
+    op.create_index('ix_player_games_id', 'player_games', ['id'])
+    op.create_index('ix_game_id', 'game', ['id'])
+    op.create_index('ix_users_id', 'users', ['id'])
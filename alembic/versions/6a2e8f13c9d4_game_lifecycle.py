@@ -0,0 +1,81 @@
+"""Game start/end times, message id and archive tables
+
+Revision ID: 6a2e8f13c9d4
+Revises: d41b7a9e0c52
+Create Date: 2026-10-18 00:00:00
+"""
+
+import os
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "6a2e8f13c9d4"
+down_revision = "d41b7a9e0c52"
+branch_labels = None
+depends_on = None
+
+def slot_window(time_slot, day, tz):
+    """(starts_at, ends_at) of a "19:00-19:30" slot on `day`, None if it doesn't parse."""
+    try:
+        start, end = (datetime.strptime(part.strip(), "%H:%M").time() for part in time_slot.split("-"))
+    except ValueError:
+        return None
+    starts_at = datetime.combine(day, start, tz)
+    ends_at = datetime.combine(day, end, tz)
+    if ends_at <= starts_at:
+        ends_at += timedelta(days=1)
+    return starts_at, ends_at
+
+
+def upgrade():
+    op.add_column('game', sa.Column('starts_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('game', sa.Column('ends_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('game', sa.Column('message_id', sa.BigInteger, nullable=True))
+    # The date of existing games was never stored. Active games are given their slot on the
+    # day of the migration, so tonight's game stays open; the rest are closed on the first sweep.
+    bind = op.get_bind()
+    tz = ZoneInfo(os.getenv("TIMEZONE", "UTC"))
+    today = datetime.now(tz).date()
+    windows = []
+    for game_id, time_slot in bind.execute(sa.text("SELECT id, time_slot FROM game WHERE is_active")):
+        window = slot_window(time_slot, today, tz)
+        if window:
+            windows.append({"id": game_id, "starts_at": window[0], "ends_at": window[1]})
+    if windows:
+        bind.execute(
+            sa.text("UPDATE game SET starts_at = :starts_at, ends_at = :ends_at WHERE id = :id"), windows
+        )
+    op.execute("UPDATE game SET starts_at = now(), ends_at = now() WHERE starts_at IS NULL")
+    op.alter_column('game', 'starts_at', nullable=False)
+    op.alter_column('game', 'ends_at', nullable=False)
+    op.create_index('ix_game_ends_at', 'game', ['ends_at'])
+
+    op.create_table(
+        'game_archive',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('time_slot', sa.String, nullable=False),
+        sa.Column('group_id', sa.BigInteger, nullable=False),
+        sa.Column('starts_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('ends_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('archived_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+    op.create_table(
+        'player_games_archive',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('game_id', sa.Integer, nullable=False),
+        sa.Column('player_id', sa.BigInteger, nullable=False),
+        sa.Column('status', postgresql.ENUM(name='player_status', create_type=False), nullable=False),
+        sa.Index('ix_player_games_archive_game_id', 'game_id')
+    )
+
+def downgrade():
+    op.drop_table('player_games_archive')
+    op.drop_table('game_archive')
+    op.drop_index('ix_game_ends_at', table_name='game')
+    op.drop_column('game', 'message_id')
+    op.drop_column('game', 'ends_at')
+    op.drop_column('game', 'starts_at')
@@ -0,0 +1,32 @@
+"""Make (game_id, player_id) unique in player_games
+
+Revision ID: 70929ae8b964
+Revises: e3ae9e0a2fa2
+Create Date: 2026-10-18 00:00:00
+"""
+
+from alembic import op
+
+revision = "70929ae8b964"
+down_revision = "e3ae9e0a2fa2"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Drop duplicate votes left by concurrent taps, keeping the most recent row
+    op.execute(
+        """
+        DELETE FROM player_games a
+        USING player_games b
+        WHERE a.game_id = b.game_id
+          AND a.player_id = b.player_id
+          AND a.id < b.id
+        """
+    )
+
+    op.create_unique_constraint(
+        'uq_player_games_game_player', 'player_games', ['game_id', 'player_id']
+    )
+
+def downgrade():
+    op.drop_constraint('uq_player_games_game_player', 'player_games', type_='unique')
@@ -0,0 +1,30 @@
+"""Create delayed_jobs table for persisted delayed actions
+
+Revision ID: 9c1f4e2a7b30
+Revises: 5040863eb44e
+Create Date: 2026-10-18 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "9c1f4e2a7b30"
+down_revision = "5040863eb44e"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'delayed_jobs',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('action', sa.String, nullable=False),
+        sa.Column('kwargs', postgresql.JSONB, nullable=False, server_default='{}'),
+        sa.Column('run_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('owner', sa.String, nullable=True),
+        sa.Index('ix_delayed_jobs_run_at', 'run_at'),
+        sa.Index('ix_delayed_jobs_owner', 'owner')
+    )
+
+def downgrade():
+    op.drop_table('delayed_jobs')
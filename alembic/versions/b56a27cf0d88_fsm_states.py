@@ -0,0 +1,28 @@
+"""Create fsm_states table for the persistent FSM storage
+
+Revision ID: b56a27cf0d88
+Revises: 70929ae8b964
+Create Date: 2026-10-18 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "b56a27cf0d88"
+down_revision = "70929ae8b964"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'fsm_states',
+        sa.Column('key', sa.String, primary_key=True),
+        sa.Column('state', sa.String, nullable=True),
+        sa.Column('data', postgresql.JSONB, nullable=False, server_default='{}'),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Index('ix_fsm_states_updated_at', 'updated_at')
+    )
+
+def downgrade():
+    op.drop_table('fsm_states')
@@ -0,0 +1,46 @@
+"""Create broadcast_jobs and broadcast_deliveries tables
+
+Revision ID: b87e2d4c1f06
+Revises: f3c5d0b8a217
+Create Date: 2026-10-18 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "b87e2d4c1f06"
+down_revision = "f3c5d0b8a217"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'broadcast_jobs',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('time_slot', sa.String, nullable=False),
+        sa.Column('status', sa.Enum('running', 'done', name='broadcast_status'), nullable=False,
+                  server_default='running'),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('owner', sa.String, nullable=True),
+        sa.Column('heartbeat_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now())
+    )
+    op.create_table(
+        'broadcast_deliveries',
+        sa.Column('job_id', sa.Integer, sa.ForeignKey('broadcast_jobs.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('group_id', sa.BigInteger, primary_key=True),
+        sa.Column('game_id', sa.Integer, sa.ForeignKey('game.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('status', sa.Enum('pending', 'sent', 'failed', name='delivery_status'), nullable=False,
+                  server_default='pending'),
+        sa.Column('message_id', sa.BigInteger, nullable=True),
+        sa.Column('error', sa.String, nullable=True),
+        sa.Column('permanent', sa.Boolean, nullable=False, server_default=sa.false()),
+        sa.Column('migrate_to_chat_id', sa.BigInteger, nullable=True),
+        sa.Index('ix_broadcast_deliveries_pending', 'job_id', postgresql_where=sa.text("status = 'pending'"))
+    )
+
+def downgrade():
+    op.drop_table('broadcast_deliveries')
+    op.drop_table('broadcast_jobs')
+    sa.Enum(name='delivery_status').drop(op.get_bind())
+    sa.Enum(name='broadcast_status').drop(op.get_bind())
@@ -0,0 +1,33 @@
+"""Create notification_outbox table for admin vote digests
+
+Revision ID: d41b7a9e0c52
+Revises: 9c1f4e2a7b30
+Create Date: 2026-10-18 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "d41b7a9e0c52"
+down_revision = "9c1f4e2a7b30"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'notification_outbox',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('game_id', sa.Integer, sa.ForeignKey('game.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('time_slot', sa.String, nullable=False),
+        sa.Column('player_id', sa.BigInteger, nullable=False),
+        sa.Column('player_name', sa.String, nullable=False),
+        sa.Column('status', postgresql.ENUM(name='player_status', create_type=False), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.Column('attempts', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('next_attempt_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.Index('ix_notification_outbox_next_attempt_at', 'next_attempt_at')
+    )
+
+def downgrade():
+    op.drop_table('notification_outbox')
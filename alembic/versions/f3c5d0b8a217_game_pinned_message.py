@@ -0,0 +1,22 @@
+"""Pinned message id of each game
+
+Revision ID: f3c5d0b8a217
+Revises: 6a2e8f13c9d4
+Create Date: 2026-10-18 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "f3c5d0b8a217"
+down_revision = "6a2e8f13c9d4"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('game', sa.Column('pinned_message_id', sa.BigInteger, nullable=True))
+    # Until now every delivered game message was pinned right away
+    op.execute("UPDATE game SET pinned_message_id = message_id WHERE is_active AND message_id IS NOT NULL")
+
+def downgrade():
+    op.drop_column('game', 'pinned_message_id')
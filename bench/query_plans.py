@@ -0,0 +1,224 @@
+"""
+Query plans and latencies of the hot query shapes, with and without the
+indexes added in revisions 70929ae8b964 and 5040863eb44e.
+
+Run against a local database migrated to head (``alembic upgrade head``),
+never against production: it seeds ~1M player_games rows and temporarily
+drops indexes. The vote is measured on the exact statement ``record_vote``
+executes, every execution in a transaction that is rolled back.
+
+    BOT_TOKEN=42:BENCH ADMIN_ID=1 python bench/query_plans.py --seed --player-games 1000000
+    BOT_TOKEN=42:BENCH ADMIN_ID=1 python bench/query_plans.py --repeat 200
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import statistics
+import sys
+import time
+
+import asyncpg
+from sqlalchemy.dialects.postgresql.asyncpg import dialect as asyncpg_dialect
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from votes import vote_statement
+
+# Dropped inside a rolled back transaction to measure the "before" numbers
+NEW_INDEXES = ["ix_game_group_id_id", "ix_game_active", "ix_player_games_player_id"]
+NEW_CONSTRAINTS = {"player_games": "uq_player_games_game_player"}
+
+QUERIES = {
+    "roster of a game": (
+        "SELECT pg.player_id, u.name, pg.status FROM player_games pg "
+        "JOIN users u ON u.telegram_id = pg.player_id WHERE pg.game_id = $1 ORDER BY pg.id",
+        lambda s: (s["game_id"],),
+    ),
+    "games of a group": (
+        "SELECT id, time_slot FROM game WHERE group_id = $1 ORDER BY id DESC LIMIT 20",
+        lambda s: (s["group_id"],),
+    ),
+    "active games": (
+        "SELECT id, group_id, time_slot FROM game WHERE is_active ORDER BY id LIMIT 20",
+        lambda s: (),
+    ),
+    "votes of a player": (
+        "SELECT count(*) FROM player_games WHERE player_id = $1",
+        lambda s: (s["player_id"],),
+    ),
+    "user by telegram_id": (
+        "SELECT name FROM users WHERE telegram_id = $1",
+        lambda s: (s["player_id"],),
+    ),
+}
+
+
+def record_vote_query(s: dict) -> tuple:
+    """record_vote's statement and arguments for the sampled vote, flipped so it is a changed vote."""
+    status = "declined" if s["status"] == "joined" else "joined"
+    compiled = vote_statement(s["game_id"], s["group_id"], s["player_id"], status).compile(dialect=asyncpg_dialect())
+    return compiled.string, tuple(compiled.params[name] for name in compiled.positiontup)
+
+
+# Statements that write, every execution is rolled back
+WRITES = {
+    "record_vote": record_vote_query,
+}
+
+
+@contextlib.asynccontextmanager
+async def rolled_back(conn: asyncpg.Connection):
+    # A savepoint when a transaction is already open
+    transaction = conn.transaction()
+    await transaction.start()
+    try:
+        yield
+    finally:
+        await transaction.rollback()
+
+
+def database_url() -> str:
+    url = os.getenv("BENCH_DATABASE_URL")
+    if not url:
+        url = (
+            f"postgresql://{os.getenv('DB_USER', 'postgres')}:{os.getenv('DB_PASSWORD', '1234')}"
+            f"@{os.getenv('DB_HOST', 'localhost')}:{os.getenv('DB_PORT', '5432')}"
+            f"/{os.getenv('DB_NAME', 'mafia_bot_db')}"
+        )
+    return url.replace("postgresql+asyncpg://", "postgresql://")
+
+
+async def seed(conn: asyncpg.Connection, groups: int, users: int, games: int, player_games: int):
+    print(f"Seeding {groups} groups, {users} users, {games} games, ~{player_games} player_games...")
+    started = time.perf_counter()
+    async with conn.transaction():
+        await conn.execute(
+            "INSERT INTO groups (id, title) "
+            "SELECT -1000000000000 - g, 'Bench group ' || g FROM generate_series(1, $1) g "
+            "ON CONFLICT DO NOTHING",
+            groups,
+        )
+        await conn.execute(
+            "INSERT INTO users (telegram_id, name) "
+            "SELECT 9000000000 + u, 'Bench user ' || u FROM generate_series(1, $1) u "
+            "ON CONFLICT DO NOTHING",
+            users,
+        )
+        # About 1% of the games stay active, like in production
+        await conn.execute(
+            "INSERT INTO game (time_slot, is_active, group_id, starts_at, ends_at) "
+            "SELECT '19:00-19:30', random() < 0.01, -1000000000000 - (1 + g % $2), now(), now() "
+            "FROM generate_series(1, $1) g",
+            games, groups,
+        )
+        await conn.execute(
+            "INSERT INTO player_games (game_id, player_id, status) "
+            "SELECT g.id, 9000000000 + 1 + (random() * ($2 - 1))::int, "
+            "       (CASE WHEN random() < 0.7 THEN 'joined' ELSE 'declined' END)::player_status "
+            "FROM game g CROSS JOIN generate_series(1, $1) "
+            "ON CONFLICT DO NOTHING",
+            max(1, player_games // games), users,
+        )
+    await conn.execute("ANALYZE")
+    print(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+
+async def sample(conn: asyncpg.Connection) -> dict:
+    row = await conn.fetchrow(
+        "SELECT pg.game_id, pg.player_id, pg.status::text AS status, g.group_id FROM player_games pg "
+        "JOIN game g ON g.id = pg.game_id "
+        "ORDER BY pg.id DESC LIMIT 1"
+    )
+    if row is None:
+        raise SystemExit("No data to benchmark, run with --seed first")
+    return dict(row)
+
+
+async def measure(conn: asyncpg.Connection, params: dict, repeat: int) -> dict:
+    results = {}
+    for name, (sql, args) in QUERIES.items():
+        values = args(params)
+        plan = await conn.fetch(f"EXPLAIN (ANALYZE, BUFFERS) {sql}", *values)
+        statement = await conn.prepare(sql)
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            await statement.fetch(*values)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        results[name] = {
+            "plan": "\n".join(r[0] for r in plan),
+            "p50": statistics.median(timings),
+            "p99": timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+        }
+
+    for name, query in WRITES.items():
+        sql, values = query(params)
+        timings = []
+        try:
+            async with rolled_back(conn):
+                plan = await conn.fetch(f"EXPLAIN (ANALYZE, BUFFERS) {sql}", *values)
+                statement = await conn.prepare(sql)
+            for _ in range(repeat):
+                async with rolled_back(conn):
+                    started = time.perf_counter()
+                    await statement.fetch(*values)
+                    timings.append((time.perf_counter() - started) * 1000)
+        except asyncpg.PostgresError as e:
+            # The upsert's ON CONFLICT can't run without the unique constraint dropped for "before"
+            print(f"{name}: {e}")
+            results[name] = None
+            continue
+        timings.sort()
+        results[name] = {
+            "plan": "\n".join(r[0] for r in plan),
+            "p50": statistics.median(timings),
+            "p99": timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+        }
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", action="store_true", help="insert synthetic data first")
+    parser.add_argument("--groups", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--games", type=int, default=50000)
+    parser.add_argument("--player-games", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=100, help="executions per query")
+    parser.add_argument("--plans", action="store_true", help="print full query plans")
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(database_url())
+    try:
+        if args.seed:
+            await seed(conn, args.groups, args.users, args.games, args.player_games)
+        params = await sample(conn)
+
+        # DDL is transactional in Postgres, so the indexes come back on rollback
+        async with rolled_back(conn):
+            for index in NEW_INDEXES:
+                await conn.execute(f"DROP INDEX IF EXISTS {index}")
+            for table, constraint in NEW_CONSTRAINTS.items():
+                await conn.execute(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {constraint}")
+            before = await measure(conn, params, args.repeat)
+        after = await measure(conn, params, args.repeat)
+    finally:
+        await conn.close()
+
+    print(f"\n{'query':<36}{'before p50':>12}{'p99':>10}{'after p50':>12}{'p99':>10}  (ms)")
+    for name in [*QUERIES, *WRITES]:
+        b, a = before[name], after[name]
+        before_text = f"{b['p50']:>12.3f}{b['p99']:>10.3f}" if b else f"{'-':>12}{'-':>10}"
+        print(f"{name:<36}{before_text}{a['p50']:>12.3f}{a['p99']:>10.3f}")
+
+    if args.plans:
+        for name in [*QUERIES, *WRITES]:
+            if before[name]:
+                print(f"\n=== {name} (before)\n{before[name]['plan']}")
+            print(f"=== {name} (after)\n{after[name]['plan']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
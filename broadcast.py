@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+
+from config import (
+    BROADCAST_CONCURRENCY,
+    BROADCAST_RATE,
+    BROADCAST_CHAT_RATE,
+    BROADCAST_CHAT_BURST,
+    BROADCAST_MAX_RETRIES,
+    BROADCAST_PROGRESS_INTERVAL,
+)
+
+# Per-chat buckets are dropped once this many are tracked and they are idle again.
+MAX_CHAT_BUCKETS = 10000
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second with bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        # The lock keeps waiters in FIFO order, so nobody starves behind a burst.
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Block every acquisition for `seconds` (used after a 429 from Telegram)."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def is_idle(self) -> bool:
+        now = time.monotonic()
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.blocked_until
+
+
+@dataclass
+class BroadcastResult:
+    total: int
+    delivered: dict = field(default_factory=dict)
+    failed: dict = field(default_factory=dict)
+
+    @property
+    def done(self) -> int:
+        return len(self.delivered) + len(self.failed)
+
+
+class Broadcaster:
+    """
+    Fans Bot API calls out to many chats with bounded concurrency.
+
+    Every call goes through a global token bucket and a per-chat one, so the
+    total duration of a broadcast depends on Telegram's rate limits rather
+    than on the round-trip time of each request.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        concurrency: int = BROADCAST_CONCURRENCY,
+        rate: float = BROADCAST_RATE,
+        chat_rate: float = BROADCAST_CHAT_RATE,
+        chat_burst: int = BROADCAST_CHAT_BURST,
+        max_retries: int = BROADCAST_MAX_RETRIES,
+    ):
+        self.bot = bot
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate, capacity=max(1, int(rate)))
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._chat_buckets = {}
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= MAX_CHAT_BUCKETS:
+                self._chat_buckets = {
+                    key: value for key, value in self._chat_buckets.items() if not value.is_idle()
+                }
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def call(self, chat_id: int, method: TelegramMethod):
+        """Execute a Bot API method for `chat_id`, honouring rate limits and `retry_after`."""
+        chat_bucket = self._chat_bucket(chat_id)
+        attempt = 0
+        while True:
+            await chat_bucket.acquire()
+            await self.bucket.acquire()
+            try:
+                return await self.bot(method)
+            except TelegramRetryAfter as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                logging.warning(f"Flood control in chat {chat_id}, retrying in {e.retry_after}s")
+                chat_bucket.pause(e.retry_after)
+                self.bucket.pause(e.retry_after)
+
+    async def run(self, chat_ids, deliver, on_progress=None,
+                  progress_interval: float = BROADCAST_PROGRESS_INTERVAL) -> BroadcastResult:
+        """
+        Run `deliver(chat_id)` for every chat with at most `concurrency` in flight.
+
+        `on_progress(result)` is awaited every `progress_interval` seconds while
+        the broadcast is running and once more when it has finished.
+        """
+        chat_ids = list(chat_ids)
+        result = BroadcastResult(total=len(chat_ids))
+        pending = iter(chat_ids)
+
+        async def worker():
+            for chat_id in pending:
+                try:
+                    result.delivered[chat_id] = await deliver(chat_id)
+                except Exception as e:
+                    result.failed[chat_id] = e
+                    logging.warning(f"Broadcast to chat {chat_id} failed: {e}")
+
+        async def report():
+            try:
+                await on_progress(result)
+            except Exception as e:
+                logging.warning(f"Failed to report broadcast progress: {e}")
+
+        async def reporter():
+            reported = -1
+            while True:
+                await asyncio.sleep(progress_interval)
+                if result.done != reported:
+                    reported = result.done
+                    await report()
+
+        progress_task = asyncio.create_task(reporter()) if on_progress else None
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(chat_ids)))))
+        finally:
+            if progress_task:
+                progress_task.cancel()
+
+        if on_progress:
+            await report()
+        return result
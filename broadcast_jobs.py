@@ -0,0 +1,374 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+
+from aiogram.exceptions import TelegramMigrateToChat
+from aiogram.methods import SendMessage
+from sqlalchemy import delete, func, insert, literal, select, update
+
+from broadcast import Broadcaster
+from config import ADMIN_ID, BROADCAST_COMMIT_CHUNK, BROADCAST_COMMIT_INTERVAL, BROADCAST_LEASE
+from jobs import process_name
+from keyboard import join_keyboard_json
+from lifecycle import parse_time_slot
+from models import BroadcastDelivery, BroadcastJob, Game, Group
+from permissions import is_permanent_failure
+from pins import PinPipeline
+
+
+class LeaseLost(Exception):
+    """Another process took the broadcast job over, this one must stop sending."""
+
+
+def announcement(time_slot: str) -> str:
+    return f"📢 **A new Mafia game is scheduled at {time_slot}!** Will you join?"
+
+
+def summary(time_slot: str, sent: int, failed: int, pruned: int) -> str:
+    text = f"✅ Game scheduled at {time_slot} for {sent} groups!"
+    if failed:
+        text += f"\n❌ Failed to send in {failed} groups."
+    if pruned:
+        text += f"\n🗑 Removed {pruned} groups the bot can no longer post to."
+    if sent:
+        text += "\n📌 Pinning the messages in the background."
+    return text
+
+
+async def prune_groups(session, dead: dict, migrated: dict) -> int:
+    """
+    Drop groups that will never accept our messages with their new game,
+    dead is {group_id: game_id}; groups upgraded to supergroups are kept
+    under their new id, migrated is {old id: new id}. Returns how many
+    groups were dropped.
+    """
+    for chat_id, new_id in migrated.items():
+        if await session.get(Group, new_id) is None:
+            await session.execute(update(Group).where(Group.id == chat_id).values(id=new_id))
+        else:
+            await session.execute(delete(Group).where(Group.id == chat_id))
+        await session.execute(
+            update(Game).where(Game.group_id == chat_id).values(group_id=new_id)
+        )
+
+    if dead:
+        await session.execute(delete(Game).where(Game.id.in_(list(dead.values()))))
+        await session.execute(delete(Group).where(Group.id.in_(list(dead))))
+    await session.commit()
+    return len(dead)
+
+
+class BroadcastJobs:
+    """
+    Announces new games to every group as a persisted broadcast job.
+
+    `create` stores the job, a game per group and a pending delivery per
+    group in one short transaction. `run` then sends the pending deliveries
+    and commits their outcome every BROADCAST_COMMIT_CHUNK results or
+    BROADCAST_COMMIT_INTERVAL seconds, so no transaction stays open during
+    the sends.
+
+    The process running a job owns it and renews its heartbeat with every
+    commit, and while the messages are pinned afterwards; the job is only
+    marked done once they are. `resume` runs periodically and takes over
+    jobs whose owner stopped renewing it for BROADCAST_LEASE seconds,
+    claiming them with SKIP LOCKED; a message sent right before the owner
+    died whose result was not committed yet is sent again.
+    """
+
+    def __init__(self, broadcaster: Broadcaster, session_factory, pins: PinPipeline,
+                 chunk_size: int = BROADCAST_COMMIT_CHUNK, commit_interval: float = BROADCAST_COMMIT_INTERVAL,
+                 lease: float = BROADCAST_LEASE):
+        self.broadcaster = broadcaster
+        self.session_factory = session_factory
+        self.pins = pins
+        self.chunk_size = chunk_size
+        self.commit_interval = commit_interval
+        self.lease = lease
+        self.owner = process_name()
+        self._running = set()
+        self._stopping = False
+
+    async def create(self, session, time_slot: str, exclude=()) -> tuple:
+        """Create the job with its games and deliveries and commit, returns (job_id, group count)."""
+        job = BroadcastJob(time_slot=time_slot, owner=self.owner)
+        session.add(job)
+        await session.flush()
+
+        starts_at, ends_at = parse_time_slot(time_slot)
+        groups = select(
+            literal(time_slot),
+            literal(starts_at, Game.starts_at.type),
+            literal(ends_at, Game.ends_at.type),
+            Group.id,
+        )
+        if exclude:
+            groups = groups.where(Group.id.not_in(exclude))
+        games = (
+            insert(Game)
+            .from_select([Game.time_slot, Game.starts_at, Game.ends_at, Game.group_id], groups)
+            .returning(Game.group_id, Game.id)
+            .cte("games")
+        )
+        result = await session.execute(
+            insert(BroadcastDelivery)
+            .from_select(
+                [BroadcastDelivery.job_id, BroadcastDelivery.group_id, BroadcastDelivery.game_id],
+                select(literal(job.id), games.c.group_id, games.c.id),
+            )
+            .returning(BroadcastDelivery.group_id)
+        )
+        count = len(result.all())
+        await session.commit()
+        return job.id, count
+
+    async def run(self, job_id: int, time_slot: str, on_progress=None) -> tuple:
+        """
+        Send the job's pending deliveries and finish it. Returns the
+        (sent, failed, pruned) group counts of the whole job, including
+        deliveries made before it was interrupted.
+        """
+        return await self._track(self._run(job_id, time_slot, on_progress))
+
+    async def resume(self):
+        """Take over the jobs whose owner is gone, finish them and report them to the admin."""
+        while not self._stopping and (job := await self._claim()) is not None:
+            job_id, time_slot = job
+            logging.info(f"Resuming broadcast job {job_id} for the game at {time_slot}")
+            try:
+                sent, failed, pruned = await self.run(job_id, time_slot)
+                await self.broadcaster.bot.send_message(
+                    ADMIN_ID, f"🔁 Resumed an interrupted broadcast.\n{summary(time_slot, sent, failed, pruned)}"
+                )
+            except Exception:
+                logging.exception(f"Resuming broadcast job {job_id} failed")
+
+    async def stop(self):
+        self._stopping = True
+        for task in self._running:
+            task.cancel()
+        await asyncio.gather(*self._running, return_exceptions=True)
+
+    def _track(self, coro) -> asyncio.Task:
+        if self._stopping:
+            coro.close()
+            raise RuntimeError("Broadcasts are stopping")
+        # Tracked so shutdown can interrupt it, the unsent deliveries stay pending
+        task = asyncio.create_task(coro)
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+        return task
+
+    async def _claim(self):
+        """Take over one running job whose lease expired, returns (job_id, time_slot) or None."""
+        async with self.session_factory() as session:
+            expired = (
+                select(BroadcastJob.id)
+                .where(
+                    BroadcastJob.status == "running",
+                    BroadcastJob.heartbeat_at < datetime.now(timezone.utc) - timedelta(seconds=self.lease),
+                )
+                .order_by(BroadcastJob.id)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+                .scalar_subquery()
+            )
+            result = await session.execute(
+                update(BroadcastJob)
+                .where(BroadcastJob.id == expired)
+                .values(owner=self.owner, heartbeat_at=func.now())
+                .returning(BroadcastJob.id, BroadcastJob.time_slot)
+                .execution_options(synchronize_session=False)
+            )
+            job = result.first()
+            await session.commit()
+        return job
+
+    async def _run(self, job_id: int, time_slot: str, on_progress=None) -> tuple:
+        async with self.session_factory() as session:
+            result = await session.execute(
+                select(BroadcastDelivery.group_id, BroadcastDelivery.game_id, BroadcastDelivery.status)
+                .where(BroadcastDelivery.job_id == job_id)
+            )
+            deliveries = result.all()
+        groups = {group_id for group_id, _, _ in deliveries}
+        games = {group_id: game_id for group_id, game_id, status in deliveries if status == "pending"}
+
+        text = announcement(time_slot)
+
+        async def send(chat_id: int, game_id: int):
+            # Built without validation, the arguments are known to be valid and the keyboard is pre-serialized
+            return await self.broadcaster.call(chat_id, SendMessage.model_construct(
+                chat_id=chat_id,
+                text=text,
+                reply_markup=join_keyboard_json(game_id)
+            ))
+        # (group_id, message_id, error, permanent, migrate_to_chat_id) of the deliveries not committed yet
+        outcomes = []
+
+        async def deliver(chat_id: int):
+            if lease_lost:
+                raise LeaseLost(job_id)
+            migrate_to = None
+            try:
+                try:
+                    game_message = await send(chat_id, games[chat_id])
+                except TelegramMigrateToChat as e:
+                    migrate_to = e.migrate_to_chat_id
+                    if migrate_to in groups:
+                        # The supergroup gets a game of its own in this job
+                        raise
+                    # The delivery keeps the old id, the group is moved to the new one when the job is done
+                    game_message = await send(migrate_to, games[chat_id])
+            except Exception as e:
+                outcomes.append((chat_id, None, str(e), is_permanent_failure(e), migrate_to))
+                raise
+            else:
+                outcomes.append((chat_id, game_message.message_id, None, False, migrate_to))
+                return game_message.message_id
+            finally:
+                if len(outcomes) >= self.chunk_size:
+                    wake.set()
+
+        async def committer():
+            nonlocal lease_lost
+            while not finished:
+                try:
+                    await asyncio.wait_for(wake.wait(), self.commit_interval)
+                except asyncio.TimeoutError:
+                    pass
+                wake.clear()
+                # Committed even when empty, it renews the lease
+                batch = outcomes[:]
+                del outcomes[:]
+                try:
+                    if not await self._commit(job_id, games, batch):
+                        logging.error(f"Broadcast job {job_id} was taken over by another process, stopping")
+                        lease_lost = True
+                        return
+                except Exception:
+                    logging.exception(f"Failed to commit the progress of broadcast job {job_id}, retrying")
+                    outcomes[:0] = batch
+
+        finished = False
+        lease_lost = False
+        wake = asyncio.Event()
+        committer_task = asyncio.create_task(committer())
+        try:
+            await self.broadcaster.run(games, deliver, on_progress=on_progress)
+        finally:
+            # Whatever was sent is committed, even when we are being stopped
+            finished = True
+            wake.set()
+            await committer_task
+            if outcomes:
+                await self._commit(job_id, games, outcomes)
+        if lease_lost:
+            raise LeaseLost(job_id)
+        return await self._finish(job_id)
+
+    async def _finish(self, job_id: int) -> tuple:
+        """
+        Prune and pin from all of the job's deliveries, not only this run's.
+        The job is marked done once the pins are, see `_pin`.
+        """
+        async with self.session_factory() as session:
+            result = await session.execute(
+                select(
+                    BroadcastDelivery.group_id,
+                    BroadcastDelivery.game_id,
+                    BroadcastDelivery.status,
+                    BroadcastDelivery.message_id,
+                    BroadcastDelivery.permanent,
+                    BroadcastDelivery.migrate_to_chat_id,
+                )
+                .where(BroadcastDelivery.job_id == job_id)
+            )
+            deliveries = result.all()
+            groups = {group_id for group_id, *_ in deliveries}
+            messages, games, dead, migrated = {}, {}, {}, {}
+            duplicates = []
+            failed = 0
+            for group_id, game_id, status, message_id, permanent, migrate_to in deliveries:
+                if migrate_to is not None:
+                    migrated[group_id] = migrate_to
+                if status == "sent":
+                    # Sent to the supergroup if the group was upgraded meanwhile
+                    chat_id = migrate_to or group_id
+                    messages[chat_id] = message_id
+                    games[chat_id] = game_id
+                elif migrate_to in groups:
+                    # Not sent, the supergroup has its own game and message
+                    duplicates.append(game_id)
+                elif status == "failed":
+                    failed += 1
+                    if migrate_to is None and permanent:
+                        dead[group_id] = game_id
+
+            if duplicates:
+                await session.execute(delete(Game).where(Game.id.in_(duplicates)))
+            pruned = await prune_groups(session, dead, migrated)
+
+        if not self._stopping:
+            # Pinned in the background, so they don't delay the report. When we are
+            # stopping the job stays running and is pinned by whoever resumes it.
+            self._track(self._pin(job_id, messages, games))
+        return len(messages), failed, pruned
+
+    async def _pin(self, job_id: int, messages: dict, games: dict):
+        """Pin the job's messages while renewing its lease, then mark it done."""
+
+        async def heartbeat():
+            while True:
+                try:
+                    if not await self._commit(job_id, {}, []):
+                        logging.error(f"Broadcast job {job_id} was taken over by another process while pinning")
+                        return
+                except Exception:
+                    logging.exception(f"Failed to renew the lease of broadcast job {job_id}")
+                await asyncio.sleep(self.commit_interval)
+
+        heartbeat_task = asyncio.create_task(heartbeat())
+        try:
+            await self.pins.run(messages, games)
+        finally:
+            heartbeat_task.cancel()
+
+        async with self.session_factory() as session:
+            await session.execute(
+                update(BroadcastJob)
+                .where(BroadcastJob.id == job_id, BroadcastJob.owner == self.owner)
+                .values(status="done", finished_at=datetime.now(timezone.utc))
+            )
+            await session.commit()
+
+    async def _commit(self, job_id: int, games: dict, batch: list) -> bool:
+        """Record `batch` and renew the job's heartbeat, returns False if we no longer own the job."""
+        async with self.session_factory() as session:
+            result = await session.execute(
+                update(BroadcastJob)
+                .where(BroadcastJob.id == job_id, BroadcastJob.owner == self.owner)
+                .values(heartbeat_at=func.now())
+                .execution_options(synchronize_session=False)
+            )
+            # What we sent is recorded even if the job was taken over meanwhile
+            if batch:
+                await session.execute(update(BroadcastDelivery), [
+                    {
+                        "job_id": job_id,
+                        "group_id": chat_id,
+                        "status": "failed" if error else "sent",
+                        "message_id": message_id,
+                        "error": error,
+                        "permanent": permanent,
+                        "migrate_to_chat_id": migrate_to,
+                    }
+                    for chat_id, message_id, error, permanent, migrate_to in batch
+                ])
+            sent = [(chat_id, message_id) for chat_id, message_id, error, *_ in batch if error is None]
+            if sent:
+                await session.execute(update(Game), [
+                    {"id": games[chat_id], "message_id": message_id} for chat_id, message_id in sent
+                ])
+            await session.commit()
+        return bool(result.rowcount)
@@ -8,3 +8,77 @@ BOT_USERNAME = os.getenv("BOT_USERNAME")
 ADMIN_ID = int(os.getenv("ADMIN_ID"))
 DATABASE_URL = os.getenv("DATABASE_URL")
 ALEMBIC_DATABASE_URL = os.getenv("ALEMBIC_DATABASE_URL")
+
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() == "true"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "3600"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_QUERY_CACHE_SIZE = int(os.getenv("DB_QUERY_CACHE_SIZE", "500"))
+DB_PREPARED_STATEMENT_CACHE_SIZE = int(os.getenv("DB_PREPARED_STATEMENT_CACHE_SIZE", "200"))
+
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_CHAT_RATE = float(os.getenv("BROADCAST_CHAT_RATE", "0.33"))
+BROADCAST_CHAT_BURST = int(os.getenv("BROADCAST_CHAT_BURST", "3"))
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", "3"))
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "2"))
+BROADCAST_COMMIT_CHUNK = int(os.getenv("BROADCAST_COMMIT_CHUNK", "200"))
+BROADCAST_COMMIT_INTERVAL = float(os.getenv("BROADCAST_COMMIT_INTERVAL", "2"))
+BROADCAST_LEASE = float(os.getenv("BROADCAST_LEASE", "60"))
+
+ROSTER_EDIT_WINDOW = float(os.getenv("ROSTER_EDIT_WINDOW", "3"))
+ROSTER_CACHE_SIZE = int(os.getenv("ROSTER_CACHE_SIZE", "5000"))
+ROSTER_CACHE_TTL = float(os.getenv("ROSTER_CACHE_TTL", "21600"))
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "50000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "3600"))
+USER_CACHE_NEGATIVE_TTL = float(os.getenv("USER_CACHE_NEGATIVE_TTL", "60"))
+
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", "100"))
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+
+FSM_STORAGE = os.getenv("FSM_STORAGE", "postgres")
+FSM_STATE_TTL = float(os.getenv("FSM_STATE_TTL", "86400"))
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "1"))
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "10000"))
+
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+CHAT_PERMISSION_CACHE_SIZE = int(os.getenv("CHAT_PERMISSION_CACHE_SIZE", "20000"))
+CHAT_PERMISSION_TTL = float(os.getenv("CHAT_PERMISSION_TTL", "3600"))
+
+DELAYED_JOBS_MAX_PENDING = int(os.getenv("DELAYED_JOBS_MAX_PENDING", "10000"))
+
+ADMIN_PAGE_SIZE = int(os.getenv("ADMIN_PAGE_SIZE", "20"))
+
+NOTIFY_INTERVAL = float(os.getenv("NOTIFY_INTERVAL", "30"))
+NOTIFY_BATCH_SIZE = int(os.getenv("NOTIFY_BATCH_SIZE", "2000"))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "8"))
+NOTIFY_MAX_BACKOFF = float(os.getenv("NOTIFY_MAX_BACKOFF", "900"))
+
+WORKERS = int(os.getenv("WORKERS", "1"))
+WORKER_QUEUE_SIZE = int(os.getenv("WORKER_QUEUE_SIZE", "1000"))
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "100"))
+WORKER_CHAT_BACKLOG = int(os.getenv("WORKER_CHAT_BACKLOG", "500"))
+WORKER_SHUTDOWN_TIMEOUT = float(os.getenv("WORKER_SHUTDOWN_TIMEOUT", "30"))
+
+TIMEZONE = os.getenv("TIMEZONE", "UTC")
+GAME_SWEEP_INTERVAL = float(os.getenv("GAME_SWEEP_INTERVAL", "60"))
+GAME_CLOSE_BATCH = int(os.getenv("GAME_CLOSE_BATCH", "500"))
+GAME_ARCHIVE_AFTER = float(os.getenv("GAME_ARCHIVE_AFTER", "86400"))
+GAME_ARCHIVE_BATCH = int(os.getenv("GAME_ARCHIVE_BATCH", "500"))
+
+DB_READY_TIMEOUT = float(os.getenv("DB_READY_TIMEOUT", "60"))
+RUN_MIGRATIONS = os.getenv("RUN_MIGRATIONS", "false").lower() == "true"
+
+PIN_MAX_ATTEMPTS = int(os.getenv("PIN_MAX_ATTEMPTS", "4"))
+PIN_RETRY_DELAY = float(os.getenv("PIN_RETRY_DELAY", "2"))
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
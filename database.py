@@ -1,23 +1,49 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
-from config import DATABASE_URL
-from contextlib import asynccontextmanager
-
-engine = create_async_engine(
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base
+from config import (
     DATABASE_URL,
-    echo=True,
-    pool_size=10,
-    max_overflow=20,
-    pool_recycle=3600
+    DB_ECHO,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING,
+    DB_QUERY_CACHE_SIZE,
+    DB_PREPARED_STATEMENT_CACHE_SIZE,
 )
-AsyncSessionLocal = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
-Base = declarative_base()
+
+_engine = None
+
+
+def get_engine():
+    """The only engine of the process, created on first use so importing models stays cheap."""
+    global _engine
+    if _engine is None:
+        _engine = create_async_engine(
+            DATABASE_URL,
+            echo=DB_ECHO,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+            query_cache_size=DB_QUERY_CACHE_SIZE,
+            connect_args={"prepared_statement_cache_size": DB_PREPARED_STATEMENT_CACHE_SIZE},
+        )
+        AsyncSessionLocal.configure(bind=_engine)
+    return _engine
 
 
-@asynccontextmanager
-async def get_db():
-    async with AsyncSessionLocal() as session:
-        try:
-            yield session
-        finally:
-            await session.close()
+async def dispose_engine():
+    if _engine is not None:
+        await _engine.dispose()
+
+
+class _LazySessionMaker(async_sessionmaker):
+    def __call__(self, **local_kw) -> AsyncSession:
+        if _engine is None:
+            get_engine()
+        return super().__call__(**local_kw)
+
+
+# Everything takes its sessions from here
+AsyncSessionLocal = _LazySessionMaker(expire_on_commit=False, class_=AsyncSession)
+Base = declarative_base()
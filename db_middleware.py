@@ -1,11 +1,64 @@
 import logging
 import asyncio
+import time
+from functools import wraps
 from aiogram.types import Update
 from aiogram.dispatcher.middlewares.base import BaseMiddleware
 
 
 logging.basicConfig(level=logging.INFO)
 
+# AsyncSession methods that talk to the database, their time is added to LazySession.db_time
+TIMED_METHODS = {
+    "execute", "scalar", "scalars", "get", "stream", "stream_scalars",
+    "flush", "commit", "rollback", "refresh", "delete", "merge",
+}
+
+
+class LazySession:
+    """
+    Proxy for an AsyncSession that is only created when a handler first uses it.
+
+    Updates whose handlers never touch the database don't create a session
+    at all. `db_time` is the total time spent awaiting database calls.
+    """
+
+    def __init__(self, session_factory):
+        self._session_factory = session_factory
+        self._session = None
+        self.db_time = 0.0
+
+    @property
+    def used(self) -> bool:
+        return self._session is not None
+
+    def __getattr__(self, name):
+        if self._session is None:
+            self._session = self._session_factory()
+        attr = getattr(self._session, name)
+        if name not in TIMED_METHODS:
+            return attr
+
+        @wraps(attr)
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await attr(*args, **kwargs)
+            finally:
+                self.db_time += time.perf_counter() - started
+
+        return timed
+
+    async def commit_pending(self):
+        """Commit whatever the handler left uncommitted."""
+        if self._session is not None and self._session.in_transaction():
+            await self.commit()
+
+    async def close(self):
+        """Close the session, rolling back anything that wasn't committed."""
+        if self._session is not None:
+            await self._session.close()
+
 
 class DbSessionMiddleware(BaseMiddleware):
     def __init__(self, session_factory):
@@ -13,13 +66,19 @@ class DbSessionMiddleware(BaseMiddleware):
         self.session_factory = session_factory
 
     async def __call__(self, handler, event: Update, data: dict):
+        session = LazySession(self.session_factory)
+        data["session"] = session
         try:
-            async with self.session_factory() as session:
-                data["session"] = session
-                return await handler(event, data)
+            result = await handler(event, data)
+            await session.commit_pending()
+            return result
         except asyncio.CancelledError:
             logging.warning("Middleware task was cancelled")
             raise  # Re-raise to allow proper shutdown
         except Exception as e:
             logging.exception("Unhandled exception in middleware")
             raise
+        finally:
+            await session.close()
+            if session.used:
+                logging.debug(f"Update {event.update_id} spent {session.db_time * 1000:.1f}ms in the database")
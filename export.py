@@ -0,0 +1,125 @@
+import csv
+import json
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+from aiogram.types import InputFile
+from sqlalchemy import literal, select, union_all
+
+from config import EXPORT_CHUNK_SIZE, TIMEZONE
+from models import Game, GameArchive, Group, PlayerGame, PlayerGameArchive, User
+
+FORMATS = ("csv", "json")
+COLUMNS = (
+    "game_id", "time_slot", "starts_at", "ends_at", "group_id", "group_title",
+    "player_id", "player_name", "status", "archived",
+)
+
+
+def parse_export_args(args: str) -> dict:
+    """
+    Parse "/export" arguments: an optional format followed by
+    from=YYYY-MM-DD, to=YYYY-MM-DD and group=<id>, in any order.
+    Raises ValueError on anything else.
+    """
+    options = {"fmt": "csv", "since": None, "until": None, "group_id": None}
+    tz = ZoneInfo(TIMEZONE)
+    for arg in (args or "").split():
+        key, _, value = arg.partition("=")
+        if not value and key.lower() in FORMATS:
+            options["fmt"] = key.lower()
+        elif key == "from":
+            options["since"] = datetime.combine(date.fromisoformat(value), time(), tz)
+        elif key == "to":
+            # The whole day is included
+            options["until"] = datetime.combine(date.fromisoformat(value) + timedelta(days=1), time(), tz)
+        elif key == "group":
+            options["group_id"] = int(value)
+        else:
+            raise ValueError(f"Unknown argument: {arg}")
+    return options
+
+
+def attendance_query(since: datetime = None, until: datetime = None, group_id: int = None):
+    """Every vote, of live and archived games, one row per player and game in COLUMNS order."""
+    parts = []
+    for game, vote, archived in ((Game, PlayerGame, False), (GameArchive, PlayerGameArchive, True)):
+        columns = (
+            game.id, game.time_slot, game.starts_at, game.ends_at, game.group_id, Group.title,
+            vote.player_id, User.name, vote.status, literal(archived),
+        )
+        query = (
+            select(*(column.label(name) for name, column in zip(COLUMNS, columns)))
+            .join(vote, vote.game_id == game.id)
+            .outerjoin(Group, Group.id == game.group_id)
+            .outerjoin(User, User.telegram_id == vote.player_id)
+        )
+        if since is not None:
+            query = query.where(game.starts_at >= since)
+        if until is not None:
+            query = query.where(game.starts_at < until)
+        if group_id is not None:
+            query = query.where(game.group_id == group_id)
+        parts.append(query)
+
+    attendance = union_all(*parts).subquery("attendance")
+    return select(attendance).order_by(attendance.c.starts_at, attendance.c.game_id)
+
+
+class _Echo:
+    """A file-like object for csv.writer that hands every line back instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows, header: bool = False):
+    writer = csv.writer(_Echo())
+    if header:
+        yield writer.writerow(COLUMNS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def json_lines(rows, first: bool = False):
+    """Elements of a JSON array, the caller writes the brackets."""
+    for row in rows:
+        yield ("" if first else ",\n") + json.dumps(dict(zip(COLUMNS, row)), default=_json_default,
+                                                     ensure_ascii=False)
+        first = False
+
+
+class AttendanceExport(InputFile):
+    """
+    The attendance history as a CSV or JSON document, streamed while it is
+    uploaded: rows come from a server-side cursor EXPORT_CHUNK_SIZE at a
+    time and are encoded one chunk after another, so memory use does not
+    grow with the history.
+    """
+
+    def __init__(self, session, fmt: str = "csv", since: datetime = None, until: datetime = None,
+                 group_id: int = None):
+        super().__init__(filename=f"attendance-{datetime.now(ZoneInfo(TIMEZONE)):%Y%m%d-%H%M}.{fmt}")
+        self.session = session
+        self.fmt = fmt
+        self.query = attendance_query(since, until, group_id)
+
+    async def read(self, bot):
+        result = await self.session.stream(self.query.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+        first = True
+        if self.fmt == "json":
+            yield b"["
+        async for rows in result.partitions():
+            lines = csv_lines(rows, header=first) if self.fmt == "csv" else json_lines(rows, first=first)
+            yield "".join(lines).encode()
+            first = False
+        if self.fmt == "json":
+            yield b"]\n" if first else b"\n]\n"
+        elif first:
+            yield "".join(csv_lines((), header=True)).encode()
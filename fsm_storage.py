@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import time
+from contextlib import suppress
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+
+from cache import LRUCache
+from config import FSM_STATE_TTL, FSM_FLUSH_INTERVAL, FSM_CACHE_SIZE
+from models import FsmState
+
+# Expired rows are purged at most this often (seconds)
+PURGE_INTERVAL = 600
+
+
+class PostgresStorage(BaseStorage):
+    """
+    FSM storage backed by the fsm_states table.
+
+    Writes go to an in-memory buffer that is flushed in one transaction every
+    `flush_interval` seconds, so changing a state doesn't cost a commit on
+    the message path. Reads are served from the buffer or a local cache and
+    only fall back to the database on a miss. States not updated for `ttl`
+    seconds are treated as cleared and purged from the table.
+
+    Several processes can share the table as long as updates of one chat are
+    always handled by the same process, otherwise they may read each other's
+    state up to `flush_interval` late.
+    """
+
+    def __init__(self, session_factory, ttl: float = FSM_STATE_TTL, flush_interval: float = FSM_FLUSH_INTERVAL,
+                 cache_size: int = FSM_CACHE_SIZE, key_builder: Optional[KeyBuilder] = None):
+        self.session_factory = session_factory
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.key_builder = key_builder or DefaultKeyBuilder()
+        self._records = LRUCache(cache_size, ttl)
+        self._dirty = {}
+        self._flusher = None
+        self._purged_at = 0.0
+
+    async def _get(self, key: StorageKey) -> dict:
+        storage_key = self.key_builder.build(key)
+        record = self._dirty.get(storage_key) or self._records.get(storage_key)
+        if record is not None:
+            return record
+
+        async with self.session_factory() as session:
+            result = await session.execute(
+                select(FsmState.state, FsmState.data).where(
+                    FsmState.key == storage_key,
+                    FsmState.updated_at > datetime.now(timezone.utc) - timedelta(seconds=self.ttl),
+                )
+            )
+            row = result.first()
+
+        record = {"state": row.state, "data": row.data or {}} if row else {"state": None, "data": {}}
+        # A write may have happened while we were waiting for the database
+        record = self._dirty.get(storage_key) or self._records.get(storage_key) or record
+        self._records.set(storage_key, record)
+        return record
+
+    def _put(self, key: StorageKey, state: Optional[str], data: Dict[str, Any]):
+        storage_key = self.key_builder.build(key)
+        record = {"state": state, "data": data}
+        self._records.set(storage_key, record)
+        self._dirty[storage_key] = record
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._get(key)
+        self._put(key, state.state if isinstance(state, State) else state, record["data"])
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._get(key))["state"]
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = await self._get(key)
+        self._put(key, record["state"], data.copy())
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._get(key))["data"].copy()
+
+    async def _flush_periodically(self):
+        while self._dirty:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        """Write buffered states to the database in one transaction."""
+        if not self._dirty and time.monotonic() - self._purged_at < PURGE_INTERVAL:
+            return
+
+        pending, self._dirty = self._dirty, {}
+        now = datetime.now(timezone.utc)
+        cleared = {key for key, record in pending.items() if record["state"] is None and not record["data"]}
+        rows = [
+            {"key": key, "state": record["state"], "data": record["data"], "updated_at": now}
+            for key, record in pending.items() if key not in cleared
+        ]
+
+        try:
+            async with self.session_factory() as session:
+                if cleared:
+                    await session.execute(delete(FsmState).where(FsmState.key.in_(list(cleared))))
+                if rows:
+                    stmt = insert(FsmState)
+                    await session.execute(
+                        stmt.on_conflict_do_update(
+                            index_elements=[FsmState.key],
+                            set_={
+                                "state": stmt.excluded.state,
+                                "data": stmt.excluded.data,
+                                "updated_at": stmt.excluded.updated_at,
+                            },
+                        ),
+                        rows,
+                    )
+                if time.monotonic() - self._purged_at >= PURGE_INTERVAL:
+                    await session.execute(
+                        delete(FsmState).where(FsmState.updated_at < now - timedelta(seconds=self.ttl))
+                    )
+                    self._purged_at = time.monotonic()
+                await session.commit()
+        except Exception:
+            logging.exception("Failed to flush FSM states, will retry")
+            # Keep newer writes that happened during the failed flush
+            self._dirty = {**pending, **self._dirty}
+        except asyncio.CancelledError:
+            self._dirty = {**pending, **self._dirty}
+            raise
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._flusher
+        await self.flush()
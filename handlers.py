@@ -1,17 +1,30 @@
-import asyncio
+import html
+import logging
 from aiogram import Router, types, F, Bot
-from aiogram.filters import Command
-from aiogram.types import InlineKeyboardButton, ChatMemberUpdated, InlineKeyboardMarkup
+from aiogram.filters import Command, CommandObject
+from aiogram.types import InlineKeyboardButton, ChatMemberUpdated
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from sqlalchemy import delete
-from config import ADMIN_ID
-from keyboard import game_time_keyboard, admin_panel_keyboard, add_bot_to_group_button
-from models import User, AsyncSessionLocal, Game, PlayerGame, Group
+from config import ADMIN_ID, WORKERS
+from keyboard import (
+    game_time_keyboard, admin_panel_keyboard, add_bot_to_group_button, add_page_buttons, join_keyboard_json,
+)
+from broadcast import BroadcastResult
+from broadcast_jobs import BroadcastJobs, summary as broadcast_summary
+from votes import record_vote
+from message_editor import MessageEditor
+from roster import RosterStore
+from user_cache import UserCache
+from permissions import ChatPermissions
+from jobs import DelayedJobs
+from pagination import fetch_page, parse_cursor
+from identity import BotIdentity
+from export import AttendanceExport, parse_export_args
+from models import User, Game, Group
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from database import get_db
 
 router = Router()
 players_today = {}
@@ -21,16 +34,16 @@ class RegisterState(StatesGroup):
     waiting_for_name = State()
 
 
+class AdminSearchState(StatesGroup):
+    waiting_for_query = State()
+
+
 @router.message(Command("start"))
-async def start(message: types.Message, state: FSMContext):
+async def start(message: types.Message, state: FSMContext, users: UserCache, identity: BotIdentity):
     telegram_id = message.from_user.id
-    bot_username = (await message.bot.get_me()).username
+    bot_username = identity.username
 
-    async with get_db() as db:
-        result = await db.execute(select(User).where(User.telegram_id == telegram_id))
-        existing_user = result.scalars().first()
-
-    if existing_user:
+    if await users.get(telegram_id) is not None:
         if telegram_id == ADMIN_ID:
             await message.answer("👑 Welcome, Admin!", reply_markup=admin_panel_keyboard())
         else:
@@ -44,14 +57,16 @@ async def start(message: types.Message, state: FSMContext):
 
 
 @router.message(RegisterState.waiting_for_name)
-async def register_user(message: types.Message, state: FSMContext):
+async def register_user(message: types.Message, state: FSMContext, session: AsyncSession, users: UserCache):
     telegram_id = message.from_user.id
     user_name = message.text.strip()
 
-    async with get_db() as db:
-        new_user = User(telegram_id=telegram_id, name=user_name)
-        db.add(new_user)
-        await db.commit()
+    new_user = User(telegram_id=telegram_id, name=user_name)
+    session.add(new_user)
+    await session.commit()
+
+    # Replaces a cached "not registered" entry
+    users.remember(telegram_id, user_name)
 
     await state.clear()
 
@@ -61,8 +76,10 @@ async def register_user(message: types.Message, state: FSMContext):
 # 🤖 BOT handlers ------------------------------------------------------
 
 @router.my_chat_member()
-async def on_bot_status_update(event: ChatMemberUpdated, bot: Bot, session: AsyncSession):
+async def on_bot_status_update(event: ChatMemberUpdated, bot: Bot, session: AsyncSession,
+                               permissions: ChatPermissions, jobs: DelayedJobs):
     chat_id = event.chat.id
+    permissions.update(chat_id, event.new_chat_member)
 
     if event.new_chat_member.status in ["administrator", "creator"]:
         await bot.send_message(chat_id, "✅ Bot is ready! You can now start a game.")
@@ -77,25 +94,20 @@ async def on_bot_status_update(event: ChatMemberUpdated, bot: Bot, session: Asyn
             await session.commit()
 
     elif event.new_chat_member.status in ["kicked", "left"]:
+        permissions.forget(chat_id)
         await session.execute(delete(Group).where(Group.id == chat_id))
         await session.commit()
 
     else:
         warning_msg = await bot.send_message(chat_id, "⚠️ Please promote me to admin to start a game!")
-        await asyncio.sleep(10)
-        await bot.delete_message(chat_id, warning_msg.message_id)
-
-
-async def is_bot_admin(chat_id: int, bot: Bot) -> bool:
-    bot_member = await bot.get_chat_member(chat_id, bot.id)
-    return bot_member.status in ["administrator", "creator"]
+        await jobs.schedule("delete_message", 10, chat_id=chat_id, message_id=warning_msg.message_id)
 
 
 # 🎮 Game Handlers--------------------------------------------
 @router.message(Command("start_game"))
-async def start_game(message: types.Message, bot: Bot):
+async def start_game(message: types.Message, bot: Bot, permissions: ChatPermissions):
     """Start a game only if the bot has admin rights."""
-    if not await is_bot_admin(message.chat.id, bot):
+    if not await permissions.is_admin(bot, message.chat.id):
         await message.answer("⚠️ Please promote me to admin first!")
         return
 
@@ -103,14 +115,13 @@ async def start_game(message: types.Message, bot: Bot):
 
 
 @router.message(RegisterState.waiting_for_name)
-async def save_name(message: types.Message, state: FSMContext):
+async def save_name(message: types.Message, state: FSMContext, session: AsyncSession):
     telegram_id = message.from_user.id
     name = message.text.strip()
 
-    async with get_db() as db:
-        new_user = User(telegram_id=telegram_id, name=name)
-        db.add(new_user)
-        await db.commit()
+    new_user = User(telegram_id=telegram_id, name=name)
+    session.add(new_user)
+    await session.commit()
 
     await message.answer(f"Thank you, {name}! You are now registered.")
     await state.clear()
@@ -129,310 +140,331 @@ async def admin_no(callback: types.CallbackQuery):
 
 
 @router.callback_query(F.data.startswith("time_"))
-async def set_game_time(callback: types.CallbackQuery):
+async def set_game_time(callback: types.CallbackQuery, session: AsyncSession,
+                        permissions: ChatPermissions, broadcast_jobs: BroadcastJobs):
     time_slot = callback.data.split("_")[1]
-
-    async with AsyncSessionLocal() as session:
-        group_result = await session.execute(select(Group))
-        groups = group_result.scalars().all()
-
-        keyboard = InlineKeyboardMarkup(
-            inline_keyboard=[
-                [
-                    InlineKeyboardButton(text="✅ Join", callback_data="join_yes_{}"),
-                    InlineKeyboardButton(text="❌ No", callback_data="join_no_{}"),
-                ]
-            ]
-        )
-
-        for group in groups:
-            new_game = Game(time_slot=time_slot, group_id=group.id)
-            session.add(new_game)
-            await session.flush()
-            game_keyboard = InlineKeyboardMarkup(
-                inline_keyboard=[
-                    [
-                        InlineKeyboardButton(text="✅ Join", callback_data=f"join_yes_{new_game.id}"),
-                        InlineKeyboardButton(text="❌ No", callback_data=f"join_no_{new_game.id}"),
-                    ]
-                ]
-            )
-
-            try:
-                game_message = await callback.bot.send_message(
-                    chat_id=group.id,
-                    text=f"📢 **A new Mafia game is scheduled at {time_slot}!** Will you join?",
-                    reply_markup=game_keyboard
-                )
-
-                await callback.bot.pin_chat_message(
-                    chat_id=group.id,
-                    message_id=game_message.message_id,
-                    disable_notification=True
-                )
-
-            except Exception as e:
-                print(f"❌ Failed to send/pin message in group {group.id}: {e}")
-                continue
-
-            await asyncio.sleep(0.05)
-
-        await session.commit()
-
-    await callback.message.answer(f"✅ Game scheduled at {time_slot} for all groups!")
+    # Answer right away, the broadcast below can take much longer than the callback timeout.
     await callback.answer()
 
+    # Groups where the bot is known to have lost its admin rights are skipped
+    job_id, groups = await broadcast_jobs.create(session, time_slot, exclude=permissions.lacking_admin())
 
-async def refresh_game_message(callback: types.CallbackQuery, game_id: int):
-    async with AsyncSessionLocal() as session:
-        game = await session.execute(
-            select(Game).where(Game.id == game_id, Game.group_id == callback.message.chat.id)
-        )
-        game = game.scalar_one_or_none()
+    progress_message = await callback.message.answer(f"📤 Sending the game to {groups} groups...")
 
-        if not game:
-            await callback.answer("❌ This game has ended or doesn't belong to this group.", show_alert=True)
-            return
-
-        result = await session.execute(
-            select(User.name, PlayerGame.status)
-            .join(PlayerGame, User.telegram_id == PlayerGame.player_id)
-            .where(PlayerGame.game_id == game_id)
+    async def show_progress(result: BroadcastResult):
+        await progress_message.edit_text(
+            f"📤 Sending the game to groups: {result.done}/{result.total} "
+            f"({len(result.failed)} failed)"
         )
-        players = result.all()
 
-    joined_players = [f"✅ {p[0]}" for p in players if p[1] == "joined"]
-    declined_players = [f"❌ {p[0]}" for p in players if p[1] == "declined"]
+    sent, failed, pruned = await broadcast_jobs.run(job_id, time_slot, on_progress=show_progress)
+    await callback.message.answer(broadcast_summary(time_slot, sent, failed, pruned))
 
-    joined_text = "\n".join(joined_players) if joined_players else "No players joined yet."
-    declined_text = "\n".join(declined_players) if declined_players else "No players declined yet."
 
-    new_text = f"""
-📢 **Mafia Game Scheduled!**  
-🕒 **Time Slot:** {game.time_slot}
+GAME_MESSAGE = """
+📢 <b>Mafia Game Scheduled!</b>
+🕒 <b>Time Slot:</b> {time_slot}
 
-**Joined Players:**
+<b>Joined Players:</b>
 {joined_text}
 
-**Declined Players:**
+<b>Declined Players:</b>
 {declined_text}
-    """.strip()
+""".strip()
 
-    if callback.message.text.strip() == new_text:
-        await callback.answer("ℹ️ The message is already up to date.")
-        return
 
-    await callback.message.edit_text(new_text, reply_markup=callback.message.reply_markup)
+async def render_game_message(rosters: RosterStore, game_id: int, time_slot: str) -> str:
+    roster = await rosters.get(game_id)
+    # Rendered once per roster version, repeated edits of an unchanged roster reuse the text
+    if roster.rendered is not None and roster.rendered[0] == roster.version:
+        return roster.rendered[1]
 
-    await callback.answer()
+    # Sent in HTML parse mode, an unescaped "<" in one name would make every later edit fail
+    joined_players = [f"✅ {html.escape(name)}" for name in roster.joined.values()]
+    declined_players = [f"❌ {html.escape(name)}" for name in roster.declined.values()]
 
+    joined_text = "\n".join(joined_players) if joined_players else "No players joined yet."
+    declined_text = "\n".join(declined_players) if declined_players else "No players declined yet."
 
-@router.callback_query(F.data.startswith("join_yes_"))
-async def join_yes(callback: types.CallbackQuery):
-    """Handles when a user confirms participation."""
+    text = GAME_MESSAGE.format(
+        time_slot=html.escape(time_slot), joined_text=joined_text, declined_text=declined_text
+    )
+    roster.rendered = (roster.version, text)
+    return text
+
+
+async def vote(callback: types.CallbackQuery, status: str, session: AsyncSession,
+               message_editor: MessageEditor, rosters: RosterStore, users: UserCache):
+    """Record the user's vote, acknowledge it and schedule a refresh of the game message."""
     game_id = int(callback.data.split("_")[2])
     user_id = callback.from_user.id
 
-    async with AsyncSessionLocal() as session:
-        # ✅ Check if the game still exists
-        game = await session.get(Game, game_id)
-        if not game:
-            await callback.answer("❌ This game has ended.", show_alert=True)
-            return
+    if users.peek(user_id) is None:
+        await callback.answer("⚠️ You need to register first! Use /start.", show_alert=True)
+        return
 
-        # ✅ Check if user is registered
-        result = await session.execute(select(User).where(User.telegram_id == user_id))
-        user = result.scalars().first()
+    result = await record_vote(session, game_id, callback.message.chat.id, user_id, status)
+    await session.commit()
 
-        if not user:
-            await callback.answer("⚠️ You need to register first! Use /start.", show_alert=True)
-            return
+    users.remember(user_id, result.user_name)
+    if result.changed:
+        rosters.apply(game_id, user_id, result.user_name, status)
 
-        # ✅ Check if the user already responded
-        result = await session.execute(
-            select(PlayerGame).where(PlayerGame.game_id == game_id, PlayerGame.player_id == user_id)
-        )
-        existing_entry = result.scalars().first()
+    if result.time_slot is None:
+        await callback.answer("❌ This game has ended or doesn't belong to this group.", show_alert=True)
+        return
 
-        if existing_entry and existing_entry.status == "joined":
-            await callback.answer("ℹ️ You have already joined this game.", show_alert=True)
-            return
+    if result.user_name is None:
+        await callback.answer("⚠️ You need to register first! Use /start.", show_alert=True)
+        return
 
-        if not existing_entry:
-            new_player = PlayerGame(game_id=game_id, player_id=user_id, status="joined")
-            session.add(new_player)
-        else:
-            existing_entry.status = "joined"
+    if not result.changed:
+        await callback.answer(f"ℹ️ You have already {status} this game.", show_alert=True)
+        return
 
-        await session.commit()
+    # The admin hears about it from the periodic digest, see notifications.py
+    if status == "joined":
+        await callback.answer("✅ You have joined the game!")
+    else:
+        await callback.answer("❌ You declined the game.")
+
+    # ✅ Refresh game message, bursts of votes are coalesced into a single edit
+    message_editor.schedule(
+        callback.message.chat.id,
+        callback.message.message_id,
+        lambda: render_game_message(rosters, game_id, result.time_slot),
+        reply_markup=join_keyboard_json(game_id),
+    )
 
-        await callback.bot.send_message(
-            ADMIN_ID, f"✅ {user.name} has joined the game at {game.time_slot}."
-        )
 
-    # ✅ Refresh game message dynamically
-    await refresh_game_message(callback, game_id)
-    await callback.answer("✅ You have joined the game!")
+@router.callback_query(F.data.startswith("join_yes_"))
+async def join_yes(callback: types.CallbackQuery, session: AsyncSession, message_editor: MessageEditor,
+                   rosters: RosterStore, users: UserCache):
+    """Handles when a user confirms participation."""
+    await vote(callback, "joined", session, message_editor, rosters, users)
 
 
 @router.callback_query(F.data.startswith("join_no_"))
-async def join_no(callback: types.CallbackQuery):
+async def join_no(callback: types.CallbackQuery, session: AsyncSession, message_editor: MessageEditor,
+                  rosters: RosterStore, users: UserCache):
     """Handles when a user declines participation."""
-    game_id = int(callback.data.split("_")[2])
-    user_id = callback.from_user.id
+    await vote(callback, "declined", session, message_editor, rosters, users)
 
-    async with AsyncSessionLocal() as session:
-        # ✅ Check if the game still exists
-        game = await session.get(Game, game_id)
-        if not game:
-            await callback.answer("❌ This game has ended.", show_alert=True)
-            return
 
-        # ✅ Check if user is registered
-        result = await session.execute(select(User).where(User.telegram_id == user_id))
-        user = result.scalars().first()
+async def groups_screen(session: AsyncSession, state: FSMContext, cursor: int = None, direction: str = "next"):
+    """Text and keyboard of a page of groups, filtered by the admin's last search. None if it's empty."""
+    search = (await state.get_data()).get("group_search")
+    query = select(Group.id, Group.title)
+    if search:
+        query = query.where(Group.title.icontains(search, autoescape=True))
+    page = await fetch_page(session, query, Group.id, cursor, direction)
+    if not page.rows:
+        return None
 
-        if not user:
-            await callback.answer("⚠️ You need to register first! Use /start.", show_alert=True)
-            return
+    keyboard = InlineKeyboardBuilder()
+    for group_id, title in page.rows:
+        keyboard.add(InlineKeyboardButton(
+            text=str(title or group_id),
+            callback_data=f"view_games_{group_id}"
+        ))
 
-        # ✅ Check if the user already responded
-        result = await session.execute(
-            select(PlayerGame).where(PlayerGame.game_id == game_id, PlayerGame.player_id == user_id)
-        )
-        existing_entry = result.scalars().first()
+    text = f"📋 Groups matching \"{html.escape(search)}\":" if search else "📋 Select a group:"
+    return text, add_page_buttons(keyboard, "groups_page", page)
 
-        if existing_entry and existing_entry.status == "declined":
-            await callback.answer("ℹ️ You have already declined this game.", show_alert=True)
-            return
 
-        if not existing_entry:
-            new_player = PlayerGame(game_id=game_id, player_id=user_id, status="declined")
-            session.add(new_player)
-        else:
-            existing_entry.status = "declined"
+@router.message(F.text == "👥 View Groups")
+async def admin_view_groups(message: types.Message, session: AsyncSession, state: FSMContext):
+    await state.update_data(group_search=None)
+    screen = await groups_screen(session, state)
+    if screen is None:
+        await message.answer("❌ No groups found.")
+        return
 
-        await session.commit()
+    text, keyboard = screen
+    await message.answer(text, reply_markup=keyboard)
 
-        await callback.bot.send_message(
-            ADMIN_ID, f"❌ {user.name} has declined to join the game at {game.time_slot}."
-        )
-    await refresh_game_message(callback, game_id)
-    await callback.answer("❌ You declined the game.")
 
+@router.message(F.text == "🔎 Search Groups")
+async def admin_search_groups(message: types.Message, state: FSMContext):
+    await message.answer("🔎 Send a part of the group title:")
+    await state.set_state(AdminSearchState.waiting_for_query)
 
-@router.message(F.text == "👥 View Groups")
-async def admin_view_groups(message: types.Message):
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(select(Group))
-        groups = result.scalars().all()
 
-    if not groups:
+@router.message(AdminSearchState.waiting_for_query)
+async def admin_search_query(message: types.Message, session: AsyncSession, state: FSMContext):
+    # The search stays in the FSM data, callback data is too small to carry it between pages
+    await state.set_state(None)
+    await state.update_data(group_search=message.text.strip())
+    screen = await groups_screen(session, state)
+    if screen is None:
         await message.answer("❌ No groups found.")
         return
 
-    keyboard = InlineKeyboardBuilder()
-    for group in groups:
-        keyboard.add(InlineKeyboardButton(
-            text=str(group.title or group.id),
-            callback_data=f"view_games_{group.id}"
-        ))
+    text, keyboard = screen
+    await message.answer(text, reply_markup=keyboard)
 
-    await message.answer("📋 Select a group:", reply_markup=keyboard.as_markup())
 
+@router.callback_query(F.data.startswith("groups_page_"))
+async def admin_groups_page(callback: types.CallbackQuery, session: AsyncSession, state: FSMContext):
+    screen = await groups_screen(session, state, *parse_cursor(callback.data))
+    if screen is None:
+        await callback.message.edit_text("❌ No groups found.")
+    else:
+        text, keyboard = screen
+        await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
 
-@router.callback_query(F.data.startswith("view_games_"))
-async def admin_view_games(callback: types.CallbackQuery):
-    group_id = int(callback.data.split("_")[2])
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(select(Game).where(Game.group_id == group_id))
-        games = result.scalars().all()
 
-    if not games:
-        await callback.message.edit_text("❌ No games in this group.")
-        return
+async def games_screen(session: AsyncSession, group_id: int, cursor: int = None, direction: str = "next"):
+    """Keyboard of a page of the group's games, None if it's empty."""
+    query = select(Game.id, Game.time_slot).where(Game.group_id == group_id)
+    page = await fetch_page(session, query, Game.id, cursor, direction)
+    if not page.rows:
+        return None
 
     keyboard = InlineKeyboardBuilder()
-    for game in games:
+    for game_id, time_slot in page.rows:
         keyboard.add(InlineKeyboardButton(
-            text=f"{game.time_slot}",
-            callback_data=f"view_players_{game.id}"
+            text=f"{time_slot}",
+            callback_data=f"view_players_{game_id}"
         ))
     keyboard.adjust(2)
+    return add_page_buttons(keyboard, f"games_page_{group_id}", page)
 
-    await callback.message.edit_text(
-        "🎮 Select a game to view players:", reply_markup=keyboard.as_markup()
-    )
+
+@router.callback_query(F.data.startswith("view_games_") | F.data.startswith("games_page_"))
+async def admin_view_games(callback: types.CallbackQuery, session: AsyncSession):
+    group_id = int(callback.data.split("_")[2])
+    if callback.data.startswith("games_page_"):
+        keyboard = await games_screen(session, group_id, *parse_cursor(callback.data))
+    else:
+        keyboard = await games_screen(session, group_id)
+
+    if keyboard is None:
+        await callback.message.edit_text("❌ No games in this group.")
+    else:
+        await callback.message.edit_text("🎮 Select a game to view players:", reply_markup=keyboard)
+    await callback.answer()
 
 
 @router.callback_query(F.data.startswith("view_players_"))
-async def admin_view_players(callback: types.CallbackQuery):
+async def admin_view_players(callback: types.CallbackQuery, session: AsyncSession, rosters: RosterStore):
     game_id = int(callback.data.split("_")[2])
-    async with AsyncSessionLocal() as session:
-        game = await session.get(Game, game_id)
-        if not game:
-            await callback.answer("❌ Game not found.")
-            return
-
-        result = await session.execute(
-            select(User.name, PlayerGame.status)
-            .join(PlayerGame, User.telegram_id == PlayerGame.player_id)
-            .where(PlayerGame.game_id == game_id)
-        )
-        players = result.all()
+    game = await session.get(Game, game_id)
+    if not game:
+        await callback.answer("❌ Game not found.")
+        return
 
-    joined = [f"✅ {p[0]}" for p in players if p[1] == "joined"]
-    declined = [f"❌ {p[0]}" for p in players if p[1] == "declined"]
+    if WORKERS > 1:
+        # Votes for this game are cached by the worker owning its group, not necessarily this one
+        rosters.discard(game_id)
+
+    roster = await rosters.get(game_id)
+    joined = [f"✅ {html.escape(name)}" for name in roster.joined.values()]
+    declined = [f"❌ {html.escape(name)}" for name in roster.declined.values()]
 
     joined_text = "\n".join(joined) or "No players joined."
     declined_text = "\n".join(declined) or "No players declined."
 
     await callback.message.edit_text(f"""
-🎮 **Game at {game.time_slot}**
+🎮 <b>Game at {html.escape(game.time_slot)}</b>
 
-👥 **Joined:**
+👥 <b>Joined:</b>
 {joined_text}
 
-🚫 **Declined:**
+🚫 <b>Declined:</b>
 {declined_text}
     """.strip())
 
 
-@router.message(F.text == "📌 Active Games")
-async def show_active_games(message: types.Message):
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(select(Game).where(Game.is_active == True))
-        active_games = result.scalars().all()
-        result_group = await session.execute(select(Group))
-        groups = result_group.scalars().all()
-
-    if not active_games:
-        await message.answer("❌ No active games at the moment.")
-        return
+async def active_games_screen(session: AsyncSession, cursor: int = None, direction: str = "next"):
+    """Keyboard of a page of active games labelled with their group, None if there are none."""
+    query = (
+        select(Game.id, Game.time_slot, Game.group_id, Group.title)
+        .outerjoin(Group, Group.id == Game.group_id)
+        .where(Game.is_active == True)
+    )
+    page = await fetch_page(session, query, Game.id, cursor, direction)
+    if not page.rows:
+        return None
+
     keyboard = InlineKeyboardBuilder()
-    for game in active_games:
+    for game_id, time_slot, group_id, title in page.rows:
         keyboard.add(InlineKeyboardButton(
-            text=f"🗑 Delete {[group.title for group in groups if group.id == game.group_id]} {game.time_slot}",
-            callback_data=f"delete_game_{game.id}"
+            text=f"🗑 Delete {title or group_id} {time_slot}",
+            callback_data=f"delete_game_{game_id}"
         ))
-
     keyboard.adjust(2)
-    await message.answer("📌 **Active Games:**\nSelect a game to delete:", reply_markup=keyboard.as_markup())
+    return add_page_buttons(keyboard, "active_page", page)
+
+
+@router.message(F.text == "📌 Active Games")
+async def show_active_games(message: types.Message, session: AsyncSession):
+    keyboard = await active_games_screen(session)
+    if keyboard is None:
+        await message.answer("❌ No active games at the moment.")
+        return
+
+    await message.answer("📌 **Active Games:**\nSelect a game to delete:", reply_markup=keyboard)
+
+
+@router.callback_query(F.data.startswith("active_page_"))
+async def active_games_page(callback: types.CallbackQuery, session: AsyncSession):
+    keyboard = await active_games_screen(session, *parse_cursor(callback.data))
+    if keyboard is None:
+        await callback.message.edit_text("❌ No active games at the moment.")
+    else:
+        await callback.message.edit_text("📌 **Active Games:**\nSelect a game to delete:", reply_markup=keyboard)
+    await callback.answer()
 
 
 @router.callback_query(F.data.startswith("delete_game_"))
-async def delete_game(callback: types.CallbackQuery):
+async def delete_game(callback: types.CallbackQuery, session: AsyncSession, rosters: RosterStore):
     game_id = int(callback.data.split("_")[2])
 
-    async with AsyncSessionLocal() as session:
-        game = await session.get(Game, game_id)
-        if not game:
-            await callback.message.answer("❌ Game not found.")
-            return
-        await session.execute(delete(PlayerGame).where(PlayerGame.game_id == game_id))
-        await session.commit()
-        await session.delete(game)
-        await session.commit()
+    game = await session.get(Game, game_id)
+    if not game:
+        await callback.message.answer("❌ Game not found.")
+        return
+    # player_games rows go with it through ON DELETE CASCADE
+    await session.execute(delete(Game).where(Game.id == game_id))
+    await session.commit()
+
+    rosters.discard(game_id)
 
     await callback.message.answer(f"✅ Game at {game.time_slot} has been deleted.")
     await callback.answer()
+
+
+@router.message(Command("refresh_bot"), F.from_user.id == ADMIN_ID)
+async def admin_refresh_bot(message: types.Message, identity: BotIdentity):
+    """Reload the bot's username and settings after they were changed in @BotFather."""
+    me = await identity.refresh()
+    await message.answer(f"🔄 Bot info refreshed: @{me.username}")
+
+
+EXPORT_USAGE = "Usage: /export [csv|json] [from=YYYY-MM-DD] [to=YYYY-MM-DD] [group=<group id>]"
+
+
+@router.message(Command("export"), F.from_user.id == ADMIN_ID)
+async def admin_export(message: types.Message, command: CommandObject, session: AsyncSession):
+    """Send the attendance history (players x games x status) as a file."""
+    try:
+        options = parse_export_args(command.args)
+    except ValueError as e:
+        await message.answer(f"❌ {html.escape(str(e))}\n{html.escape(EXPORT_USAGE)}")
+        return
+
+    await message.answer("📦 Preparing the attendance export...")
+    await message.answer_document(AttendanceExport(session, **options), caption="📊 Attendance history")
+
+
+@router.message(Command("stats"), F.from_user.id == ADMIN_ID)
+async def admin_stats(message: types.Message, users: UserCache):
+    stats = users.stats()
+    lookups = stats["hits"] + stats["misses"]
+    hit_rate = stats["hits"] / lookups * 100 if lookups else 0
+    await message.answer(
+        f"📊 **User cache:** {stats['size']} entries, "
+        f"{stats['hits']} hits / {stats['misses']} misses ({hit_rate:.1f}% hit rate)"
+    )
@@ -0,0 +1,28 @@
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.types import User
+
+from config import BOT_USERNAME
+
+
+class BotIdentity:
+    """
+    The bot's own user, fetched once at startup instead of per update.
+
+    It only changes when the bot is edited in @BotFather, so it is refreshed
+    explicitly (the /refresh_bot admin command). Until the first refresh the
+    username falls back to BOT_USERNAME.
+    """
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.me: Optional[User] = None
+
+    @property
+    def username(self) -> Optional[str]:
+        return self.me.username if self.me else BOT_USERNAME
+
+    async def refresh(self) -> User:
+        self.me = await self.bot.get_me()
+        return self.me
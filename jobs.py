@@ -0,0 +1,149 @@
+import logging
+import os
+import socket
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from apscheduler.jobstores.base import JobLookupError
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from sqlalchemy import delete, insert, update
+
+from config import DELAYED_JOBS_MAX_PENDING
+from models import DelayedJob
+
+def process_name(pid: int = None) -> str:
+    """Identifies a process among the ones sharing the database, this one by default."""
+    return f"{socket.gethostname()}:{pid or os.getpid()}"
+
+
+# Action name -> coroutine function called as func(bot, **kwargs)
+ACTIONS = {}
+
+
+def action(name: str):
+    """Register a coroutine function that delayed jobs can refer to by name."""
+    def register(func):
+        ACTIONS[name] = func
+        return func
+    return register
+
+
+@action("delete_message")
+async def delete_message(bot: Bot, chat_id: int, message_id: int):
+    try:
+        await bot.delete_message(chat_id, message_id)
+    except TelegramBadRequest as e:
+        # Already deleted by someone else, or the bot lost its rights meanwhile
+        logging.info(f"Could not delete message {message_id} in chat {chat_id}: {e}")
+
+
+class DelayedJobs:
+    """
+    Actions run once after a delay, like deleting a temporary message.
+
+    Every job is a row in delayed_jobs plus a "date" job in the scheduler, so
+    handlers return right away and pending jobs survive restarts (see
+    `restore`). Rows record the process that holds them, so a restarted
+    worker only takes over the jobs of the process it replaces. At most
+    `max_pending` jobs are kept, further ones are dropped.
+    """
+
+    def __init__(self, bot: Bot, scheduler: AsyncIOScheduler, session_factory,
+                 max_pending: int = DELAYED_JOBS_MAX_PENDING):
+        self.bot = bot
+        self.scheduler = scheduler
+        self.session_factory = session_factory
+        self.max_pending = max_pending
+        self.owner = process_name()
+        self._pending = set()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    async def schedule(self, action_name: str, delay: float, **kwargs) -> Optional[int]:
+        """Run the action after `delay` seconds, returns the job id or None if it was dropped."""
+        if action_name not in ACTIONS:
+            raise ValueError(f"Unknown delayed action: {action_name}")
+        if len(self._pending) >= self.max_pending:
+            logging.warning(f"{len(self._pending)} delayed jobs pending, dropping {action_name} {kwargs}")
+            return None
+
+        run_at = datetime.now(timezone.utc) + timedelta(seconds=delay)
+        async with self.session_factory() as session:
+            result = await session.execute(
+                insert(DelayedJob)
+                .values(action=action_name, kwargs=kwargs, run_at=run_at, owner=self.owner)
+                .returning(DelayedJob.id)
+            )
+            job_id = result.scalar_one()
+            await session.commit()
+
+        self._add(job_id, action_name, kwargs, run_at)
+        return job_id
+
+    async def cancel(self, job_id: int) -> bool:
+        """Cancel a pending job, returns False if it already ran or doesn't exist."""
+        try:
+            self.scheduler.remove_job(f"delayed:{job_id}")
+        except JobLookupError:
+            return False
+        self._pending.discard(job_id)
+        await self._forget(job_id)
+        return True
+
+    async def restore(self, previous_owner: str = None):
+        """
+        Take over and reschedule persisted jobs, overdue ones run right away:
+        those of `previous_owner`, or every job when no other process is
+        running yet.
+        """
+        async with self.session_factory() as session:
+            claim = update(DelayedJob).values(owner=self.owner)
+            if previous_owner is not None:
+                claim = claim.where(DelayedJob.owner == previous_owner)
+            result = await session.execute(
+                claim
+                .returning(DelayedJob.id, DelayedJob.action, DelayedJob.kwargs, DelayedJob.run_at)
+                .execution_options(synchronize_session=False)
+            )
+            jobs = result.all()
+            await session.commit()
+
+        now = datetime.now(timezone.utc)
+        for job_id, action_name, kwargs, run_at in jobs:
+            if job_id not in self._pending:
+                self._add(job_id, action_name, kwargs, max(run_at, now))
+        if jobs:
+            logging.info(f"Restored {len(jobs)} delayed jobs")
+
+    def _add(self, job_id: int, action_name: str, kwargs: dict, run_at: datetime):
+        self._pending.add(job_id)
+        self.scheduler.add_job(
+            self._run, "date",
+            run_date=run_at,
+            args=[job_id, action_name, kwargs],
+            id=f"delayed:{job_id}",
+            replace_existing=True,
+            # Jobs restored late must still run instead of being skipped as misfired
+            misfire_grace_time=None,
+        )
+
+    async def _run(self, job_id: int, action_name: str, kwargs: dict):
+        try:
+            func = ACTIONS.get(action_name)
+            if func is None:
+                logging.error(f"Dropping delayed job {job_id}: unknown action {action_name}")
+            else:
+                await func(self.bot, **kwargs)
+        except Exception as e:
+            logging.error(f"Delayed job {job_id} ({action_name}) failed: {e}", exc_info=True)
+        finally:
+            self._pending.discard(job_id)
+            await self._forget(job_id)
+
+    async def _forget(self, job_id: int):
+        async with self.session_factory() as session:
+            await session.execute(delete(DelayedJob).where(DelayedJob.id == job_id))
+            await session.commit()
@@ -1,7 +1,13 @@
+import json
+from functools import cache
+
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from aiogram.types import InlineKeyboardButton, KeyboardButton, ReplyKeyboardMarkup
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup
+
+# Static markups never change, so they are built once (@cache) and shared by every message
 
 
+@cache
 def admin_decision_keyboard():
     builder = InlineKeyboardBuilder()
     builder.add(InlineKeyboardButton(text="Yes", callback_data="admin_yes"))
@@ -9,6 +15,7 @@ def admin_decision_keyboard():
     return builder.as_markup()
 
 
+@cache
 def game_time_keyboard():
     builder = InlineKeyboardBuilder()
     times = ["19:00-19:30", "19:30-20:00", "20:00-20:30", "20:30-21:00"]
@@ -17,22 +24,25 @@ def game_time_keyboard():
     return builder.as_markup()
 
 
+@cache
 def join_game_keyboard():
     builder = InlineKeyboardBuilder()
     builder.add(InlineKeyboardButton(text="Join Game", callback_data="register"))
     return builder.as_markup()
 
 
+@cache
 def admin_panel_keyboard():
     return ReplyKeyboardMarkup(
         keyboard=[
-            [KeyboardButton(text="👥 View Groups")],
+            [KeyboardButton(text="👥 View Groups"), KeyboardButton(text="🔎 Search Groups")],
             [KeyboardButton(text="📌 Active Games")]
         ],
         resize_keyboard=True
     )
 
 
+@cache
 def time_selection_keyboard():
     builder = InlineKeyboardBuilder()
     builder.button(text="19:00", callback_data="game_time_19:00")
@@ -43,6 +53,7 @@ def time_selection_keyboard():
     return builder.as_markup()
 
 
+@cache
 def add_bot_to_group_button(bot_username: str):
     builder = InlineKeyboardBuilder()
     builder.button(
@@ -50,3 +61,41 @@ def add_bot_to_group_button(bot_username: str):
         url=f"https://t.me/{bot_username}?startgroup&admin=1"
     )
     return builder.as_markup()
+
+
+def add_page_buttons(builder: InlineKeyboardBuilder, prefix: str, page):
+    """Add a ⬅️/➡️ row for a keyset page, with callback data "<prefix>_<direction>_<cursor>"."""
+    buttons = []
+    if page.prev_cursor is not None:
+        buttons.append(InlineKeyboardButton(text="⬅️ Prev", callback_data=f"{prefix}_prev_{page.prev_cursor}"))
+    if page.next_cursor is not None:
+        buttons.append(InlineKeyboardButton(text="Next ➡️", callback_data=f"{prefix}_next_{page.next_cursor}"))
+    if buttons:
+        builder.row(*buttons)
+    return builder.as_markup()
+
+
+def join_keyboard(game_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(text="✅ Join", callback_data=f"join_yes_{game_id}"),
+                InlineKeyboardButton(text="❌ No", callback_data=f"join_no_{game_id}"),
+            ]
+        ]
+    )
+
+
+# The join keyboard serialized once, games only differ in the id inside the callback data
+_JOIN_KEYBOARD_JSON = json.dumps(join_keyboard(0).model_dump(exclude_none=True), ensure_ascii=False)
+_JOIN_KEYBOARD_PARTS = _JOIN_KEYBOARD_JSON.split('_0"')
+
+
+def join_keyboard_json(game_id: int) -> str:
+    """
+    The join keyboard of a game as ready-to-send JSON.
+
+    Only usable as the reply_markup of methods built with model_construct,
+    which skips validation; the session sends strings as they are.
+    """
+    return f'_{game_id}"'.join(_JOIN_KEYBOARD_PARTS)
@@ -0,0 +1,140 @@
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from aiogram.exceptions import TelegramAPIError
+from aiogram.methods import UnpinChatMessage
+from sqlalchemy import delete, insert, select, update
+
+from broadcast import Broadcaster
+from config import TIMEZONE, GAME_ARCHIVE_AFTER, GAME_ARCHIVE_BATCH, GAME_CLOSE_BATCH
+from models import Game, GameArchive, PlayerGame, PlayerGameArchive
+
+
+def parse_time_slot(time_slot: str, now: datetime = None) -> tuple:
+    """
+    Turn a "19:00-19:30" slot into (starts_at, ends_at) in TIMEZONE.
+
+    The slot is the next one to come: a slot already over today is for
+    tomorrow, and one ending after midnight ends the next day.
+    """
+    tz = ZoneInfo(TIMEZONE)
+    now = now or datetime.now(tz)
+    start, end = (datetime.strptime(part.strip(), "%H:%M").time() for part in time_slot.split("-"))
+
+    starts_at = datetime.combine(now.date(), start, tz)
+    ends_at = datetime.combine(now.date(), end, tz)
+    if ends_at <= starts_at:
+        ends_at += timedelta(days=1)
+    if ends_at <= now:
+        starts_at += timedelta(days=1)
+        ends_at += timedelta(days=1)
+    return starts_at, ends_at
+
+
+class GameLifecycle:
+    """
+    Closes games once their slot is over and archives them later.
+
+    `sweep` runs periodically: it marks finished games inactive and unpins
+    their message, then moves games closed more than GAME_ARCHIVE_AFTER
+    seconds ago, with their votes, to the archive tables. Every batch is its
+    own transaction, so the hot tables are never locked for long.
+    """
+
+    def __init__(self, session_factory, broadcaster: Broadcaster):
+        self.session_factory = session_factory
+        self.broadcaster = broadcaster
+
+    async def sweep(self):
+        closed = await self.close_finished()
+        archived = await self.archive()
+        if closed or archived:
+            logging.info(f"Closed {closed} finished games, archived {archived}")
+
+    async def close_finished(self) -> int:
+        closed = 0
+        while True:
+            async with self.session_factory() as session:
+                due = (
+                    select(Game.id, Game.pinned_message_id)
+                    .where(Game.is_active == True, Game.ends_at <= datetime.now(ZoneInfo(TIMEZONE)))
+                    .order_by(Game.id)
+                    .limit(GAME_CLOSE_BATCH)
+                    .with_for_update(skip_locked=True)
+                    .subquery("due")
+                )
+                # RETURNING sees the updated row, the pinned message id comes from the subquery
+                result = await session.execute(
+                    update(Game)
+                    .where(Game.id == due.c.id)
+                    .values(is_active=False, pinned_message_id=None)
+                    .returning(Game.group_id, due.c.pinned_message_id)
+                )
+                games = result.all()
+                await session.commit()
+
+            pinned = defaultdict(list)
+            for chat_id, message_id in games:
+                if message_id:
+                    pinned[chat_id].append(message_id)
+
+            async def unpin(chat_id: int):
+                for message_id in pinned[chat_id]:
+                    await self._unpin(chat_id, message_id)
+
+            await self.broadcaster.run(pinned, unpin)
+            closed += len(games)
+            if len(games) < GAME_CLOSE_BATCH:
+                return closed
+
+    async def _unpin(self, chat_id: int, message_id: int):
+        try:
+            await self.broadcaster.call(chat_id, UnpinChatMessage(chat_id=chat_id, message_id=message_id))
+        except TelegramAPIError as e:
+            # Already unpinned, deleted, or the bot left the group
+            logging.info(f"Could not unpin message {message_id} in chat {chat_id}: {e}")
+
+    async def archive(self) -> int:
+        archived = 0
+        cutoff = datetime.now(ZoneInfo(TIMEZONE)) - timedelta(seconds=GAME_ARCHIVE_AFTER)
+        while True:
+            async with self.session_factory() as session:
+                batch = (
+                    select(Game.id)
+                    .where(Game.is_active == False, Game.ends_at <= cutoff)
+                    .order_by(Game.id)
+                    .limit(GAME_ARCHIVE_BATCH)
+                    .with_for_update(skip_locked=True)
+                    .cte("batch")
+                )
+                moved_votes = (
+                    delete(PlayerGame)
+                    .where(PlayerGame.game_id.in_(select(batch.c.id)))
+                    .returning(PlayerGame.id, PlayerGame.game_id, PlayerGame.player_id, PlayerGame.status)
+                    .cte("moved_votes")
+                )
+                archived_votes = (
+                    insert(PlayerGameArchive)
+                    .from_select(["id", "game_id", "player_id", "status"], select(moved_votes))
+                    .cte("archived_votes")
+                )
+                moved_games = (
+                    delete(Game)
+                    .where(Game.id.in_(select(batch.c.id)))
+                    .returning(Game.id, Game.time_slot, Game.group_id, Game.starts_at, Game.ends_at)
+                    .cte("moved_games")
+                )
+                result = await session.execute(
+                    insert(GameArchive)
+                    .from_select(["id", "time_slot", "group_id", "starts_at", "ends_at"], select(moved_games))
+                    .returning(GameArchive.id)
+                    .add_cte(archived_votes)
+                )
+                count = len(result.all())
+                await session.commit()
+
+            archived += count
+            if count < GAME_ARCHIVE_BATCH:
+                return archived
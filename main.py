@@ -1,26 +1,51 @@
+import sys
+import startup
+
+# Before any other import, so the profile covers them
+if "--profile-startup" in sys.argv:
+    startup.enable_profiler()
+
 import signal
 import asyncio
 import logging
+from datetime import datetime, timezone
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import BotCommand
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
-from handlers import router
-from config import BOT_TOKEN, ADMIN_ID, DATABASE_URL
+from config import (
+    BOT_TOKEN, ADMIN_ID, BOT_MODE, FSM_STORAGE, METRICS_HOST, METRICS_PORT, NOTIFY_INTERVAL, WORKERS,
+    USER_CACHE_NEGATIVE_TTL, GAME_SWEEP_INTERVAL, DATABASE_URL, DB_READY_TIMEOUT, RUN_MIGRATIONS,
+    BROADCAST_LEASE,
+)
+from database import get_engine, dispose_engine, AsyncSessionLocal
 from keyboard import admin_decision_keyboard
 from db_middleware import DbSessionMiddleware
+from broadcast import Broadcaster
+from message_editor import MessageEditor
+from roster import RosterStore
+from user_cache import UserCache
+from permissions import ChatPermissions
+from jobs import DelayedJobs
+from notifications import AdminNotifier
+from lifecycle import GameLifecycle
+from identity import BotIdentity
+from pins import PinPipeline
+from broadcast_jobs import BroadcastJobs
+from metrics import (
+    MetricsMiddleware,
+    RequestMetricsMiddleware,
+    instrument_engine,
+    register_collector,
+    start_metrics_server,
+)
 
 # Logging
 logging.basicConfig(level=logging.INFO)
 
-# DB setup
-engine = create_async_engine(DATABASE_URL, echo=True)
-async_session_factory = async_sessionmaker(engine, expire_on_commit=False)
-
 # Scheduler job
 async def ask_admin(bot: Bot):
     try:
@@ -34,20 +59,85 @@ async def ask_admin(bot: Bot):
         logging.error(f"Failed to send message: {e}", exc_info=True)
 
 
-async def main():
-    bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-    dp = Dispatcher(storage=MemoryStorage())
+def create_dispatcher(bot: Bot, scheduler: AsyncIOScheduler = None) -> Dispatcher:
+    """Build the dispatcher with its storage, shared services, middlewares and handlers."""
+    # Handlers pull in most of the project, they are only imported once a dispatcher is needed
+    from handlers import router
+
+    if FSM_STORAGE == "memory":
+        storage = MemoryStorage()
+    else:
+        from fsm_storage import PostgresStorage
+        storage = PostgresStorage(AsyncSessionLocal)
+    dp = Dispatcher(storage=storage)
+
+    dp["broadcaster"] = Broadcaster(bot)
+    dp["message_editor"] = MessageEditor(bot)
+    dp["rosters"] = RosterStore(AsyncSessionLocal)
+    # With several workers a user registers in one process and votes in another,
+    # so "not registered" can't be cached
+    dp["users"] = UserCache(AsyncSessionLocal, negative_ttl=USER_CACHE_NEGATIVE_TTL if WORKERS == 1 else 0)
+    # Likewise a group's rights changes reach its own worker, not the admin's
+    dp["permissions"] = ChatPermissions(all_chats=WORKERS == 1)
+    dp["identity"] = BotIdentity(bot)
+    dp["pins"] = PinPipeline(dp["broadcaster"], AsyncSessionLocal, dp["permissions"])
+    dp["broadcast_jobs"] = BroadcastJobs(dp["broadcaster"], AsyncSessionLocal, dp["pins"])
+    dp["jobs"] = DelayedJobs(bot, scheduler or AsyncIOScheduler(), AsyncSessionLocal)
+    dp.update.middleware(DbSessionMiddleware(session_factory=AsyncSessionLocal))
+
+    metrics_middleware = MetricsMiddleware()
+    for observer in (dp.message, dp.callback_query, dp.my_chat_member):
+        observer.middleware(metrics_middleware)
+    register_collector(lambda: {f"bot_user_cache_{key}": value for key, value in dp["users"].stats().items()})
 
-    dp.update.middleware(DbSessionMiddleware(session_factory=async_session_factory))
     dp.include_router(router)
-
-
-    await bot.set_my_commands([BotCommand(command="start", description="Start the bot")])
-
-    scheduler = AsyncIOScheduler()
-    scheduler.add_job(ask_admin, "interval", minutes=240, args=[bot])
+    return dp
+
+
+def create_bot() -> Bot:
+    return Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+
+
+async def start_services(bot: Bot, dp: Dispatcher, scheduler: AsyncIOScheduler, primary: bool = True,
+                         metrics_port: int = METRICS_PORT, replaces: str = None):
+    """
+    Start metrics and the scheduler, returns the metrics runner (or None).
+
+    Only the primary process sets the commands, runs the periodic jobs,
+    restores delayed jobs and resumes interrupted broadcasts, see
+    supervisor.py for the others. A worker restarted in place of a dead one
+    (`replaces` is that process' name) only takes over its delayed jobs.
+    """
+    bot.session.middleware(RequestMetricsMiddleware())
+    instrument_engine(get_engine())
+    metrics_runner = await start_metrics_server(METRICS_HOST, metrics_port) if metrics_port else None
+
+    me = await dp["identity"].refresh()
+    logging.info(f"Running as @{me.username}")
+
+    if primary:
+        await bot.set_my_commands([BotCommand(command="start", description="Start the bot")])
+
+        scheduler.add_job(ask_admin, "interval", minutes=240, args=[bot])
+        notifier = AdminNotifier(bot, AsyncSessionLocal)
+        scheduler.add_job(notifier.dispatch, "interval", seconds=NOTIFY_INTERVAL, max_instances=1, coalesce=True)
+        lifecycle = GameLifecycle(AsyncSessionLocal, dp["broadcaster"])
+        scheduler.add_job(lifecycle.sweep, "interval", seconds=GAME_SWEEP_INTERVAL, max_instances=1, coalesce=True)
+        # Also takes over broadcasts of a worker that died, once their lease expires
+        scheduler.add_job(
+            dp["broadcast_jobs"].resume, "interval", seconds=BROADCAST_LEASE, max_instances=1, coalesce=True,
+            next_run_time=datetime.now(timezone.utc),
+        )
     scheduler.start()
+    if replaces is not None:
+        # Restarted by the supervisor, the other workers keep their own jobs
+        await dp["jobs"].restore(previous_owner=replaces)
+    elif primary:
+        await dp["jobs"].restore()
+    return metrics_runner
+
 
+async def main():
     stop_event = asyncio.Event()
 
     def _handle_signal():
@@ -58,18 +148,80 @@ async def main():
     for sig in (signal.SIGINT, signal.SIGTERM):
         loop.add_signal_handler(sig, _handle_signal)
 
+    # A profiling run may point at a real deployment, so it changes nothing: no migrations,
+    # commands, periodic or restored jobs, resumed broadcasts or metrics port
+    profiling = isinstance(startup.profiler, startup.StartupProfiler)
+
+    with startup.profiler.phase("database ready"):
+        await startup.wait_for_database(DATABASE_URL, DB_READY_TIMEOUT)
+    if RUN_MIGRATIONS and not profiling:
+        with startup.profiler.phase("migrations"):
+            await asyncio.to_thread(startup.run_migrations)
+
+    # With several workers the profile covers the startup of one of them
+    if WORKERS > 1 and not profiling:
+        # Imported here, the workers import this module themselves
+        from supervisor import run_supervisor
+        await run_supervisor(stop_event)
+        return
+
+    with startup.profiler.phase("bot and dispatcher"):
+        bot = create_bot()
+        scheduler = AsyncIOScheduler()
+        dp = create_dispatcher(bot, scheduler)
+    with startup.profiler.phase("services"):
+        metrics_runner = await start_services(
+            bot, dp, scheduler,
+            primary=not profiling,
+            metrics_port=None if profiling else METRICS_PORT,
+        )
+
     try:
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        if profiling:
+            # Only startup is profiled, the bot stops right after the report
+            print(startup.profiler.report())
+        elif BOT_MODE == "webhook":
+            from webhook import run_webhook
+            await run_webhook(bot, dp, stop_event)
+        else:
+            await run_polling(bot, dp, stop_event)
     except asyncio.CancelledError:
         logging.info("Polling cancelled")
     finally:
-        await stop_event.wait()
-        await shutdown(bot, scheduler)
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await shutdown(bot, dp, scheduler)
+
+
+async def run_polling(bot: Bot, dp: Dispatcher, stop_event: asyncio.Event):
+    # getUpdates is rejected while a webhook from a previous webhook-mode run is still set
+    await bot.delete_webhook()
+
+    # Signals are handled by _handle_signal, so polling must not install its own handlers
+    polling = asyncio.create_task(dp.start_polling(
+        bot,
+        allowed_updates=dp.resolve_used_update_types(),
+        handle_signals=False,
+        close_bot_session=False,
+    ))
+    stopped = asyncio.create_task(stop_event.wait())
+    await asyncio.wait({polling, stopped}, return_when=asyncio.FIRST_COMPLETED)
+
+    stopped.cancel()
+    if not polling.done():
+        await dp.stop_polling()
+    await polling
+
 
-async def shutdown(bot: Bot, scheduler: AsyncIOScheduler):
+async def shutdown(bot: Bot, dp: Dispatcher, scheduler: AsyncIOScheduler):
     logging.info("Shutting down...")
     scheduler.shutdown(wait=False)
+    # Deliveries not sent yet stay pending and are resumed on the next start
+    await dp["broadcast_jobs"].stop()
+    await dp["message_editor"].drain()
+    await dp["pins"].drain()
     await bot.session.close()
+    await dispose_engine()
     logging.info("Shutdown complete")
 
 if __name__ == "__main__":
@@ -0,0 +1,66 @@
+import asyncio
+import logging
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.methods import EditMessageText
+
+from config import ROSTER_EDIT_WINDOW
+
+
+class MessageEditor:
+    """
+    Coalesces edits of the same message.
+
+    `schedule` only remembers the latest renderer for a (chat_id, message_id)
+    pair. The first edit is applied immediately, later ones at most once per
+    `window` seconds, and each edit renders the state at the time it is sent,
+    so a burst of votes ends up as one or two edits instead of one per vote.
+    """
+
+    def __init__(self, bot: Bot, window: float = ROSTER_EDIT_WINDOW):
+        self.bot = bot
+        self.window = window
+        self._pending = {}
+        self._tasks = {}
+
+    def schedule(self, chat_id: int, message_id: int, render, reply_markup=None):
+        """Queue an edit, `render()` is awaited right before editing and returns the new text."""
+        key = (chat_id, message_id)
+        self._pending[key] = (render, reply_markup)
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._run(key))
+
+    async def _run(self, key):
+        chat_id, message_id = key
+        last_text = None
+        try:
+            while key in self._pending:
+                render, reply_markup = self._pending.pop(key)
+                try:
+                    text = await render()
+                    if text != last_text:
+                        # reply_markup may be pre-serialized JSON, which only model_construct accepts
+                        await self.bot(EditMessageText.model_construct(
+                            chat_id=chat_id, message_id=message_id, text=text, reply_markup=reply_markup
+                        ))
+                        last_text = text
+                except TelegramRetryAfter as e:
+                    logging.warning(f"Edit of message {message_id} in chat {chat_id} throttled for {e.retry_after}s")
+                    self._pending.setdefault(key, (render, reply_markup))
+                    await asyncio.sleep(e.retry_after)
+                    continue
+                except TelegramBadRequest as e:
+                    if "message is not modified" not in str(e):
+                        logging.warning(f"Failed to edit message {message_id} in chat {chat_id}: {e}")
+                except Exception:
+                    logging.exception(f"Failed to edit message {message_id} in chat {chat_id}")
+
+                await asyncio.sleep(self.window)
+        finally:
+            del self._tasks[key]
+
+    async def drain(self):
+        """Wait for all scheduled edits to be applied."""
+        while self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
@@ -0,0 +1,149 @@
+import logging
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.dispatcher.middlewares.base import BaseMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiohttp import web
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Name of the handler processing the current update, inherited by tasks it starts
+current_handler = ContextVar("current_handler", default="none")
+
+
+class Counter:
+    def __init__(self, name: str, help: str, label: str):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.values = defaultdict(float)
+
+    def inc(self, label_value: str, amount: float = 1):
+        self.values[label_value] += amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for label_value, value in self.values.items():
+            yield f'{self.name}{{{self.label}="{label_value}"}} {value}'
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, label: str, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        # label value -> [count per bucket..., count above the last bucket, sum]
+        self.values = defaultdict(lambda: [0] * (len(buckets) + 2))
+
+    def observe(self, label_value: str, value: float):
+        counts = self.values[label_value]
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for label_value, counts in self.values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                yield f'{self.name}_bucket{{{self.label}="{label_value}",le="{bound}"}} {cumulative}'
+            yield f'{self.name}_sum{{{self.label}="{label_value}"}} {counts[-1]}'
+            yield f'{self.name}_count{{{self.label}="{label_value}"}} {cumulative}'
+
+
+handler_latency = Histogram("bot_handler_latency_seconds", "Time spent in update handlers.", "handler")
+handler_db_seconds = Counter("bot_handler_db_seconds_total", "Time handlers spent awaiting the database.", "handler")
+handler_statements = Counter("bot_handler_db_statements_total", "SQL statements executed by handlers.", "handler")
+handler_api_calls = Counter("bot_handler_api_calls_total", "Bot API calls made by handlers.", "handler")
+handler_errors = Counter("bot_handler_errors_total", "Handlers that raised an exception.", "handler")
+api_latency = Histogram("bot_api_latency_seconds", "Bot API request latency.", "method")
+api_retry_after = Counter("bot_api_retry_after_total", "Bot API requests rejected with 429.", "method")
+api_errors = Counter("bot_api_errors_total", "Bot API requests that failed.", "method")
+
+METRICS = [
+    handler_latency, handler_db_seconds, handler_statements, handler_api_calls, handler_errors,
+    api_latency, api_retry_after, api_errors,
+]
+_collectors = []
+
+
+def register_collector(collect):
+    """Add a callable returning {metric_name: value} gauges, evaluated on every scrape."""
+    _collectors.append(collect)
+
+
+def render() -> str:
+    lines = [line for metric in METRICS for line in metric.render()]
+    for collect in _collectors:
+        for name, value in collect().items():
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Inner middleware recording latency, errors and database time per handler."""
+
+    async def __call__(self, handler, event, data: dict):
+        name = data["handler"].callback.__name__
+        token = current_handler.set(name)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(name)
+            raise
+        finally:
+            handler_latency.observe(name, time.perf_counter() - started)
+            session = data.get("session")
+            if session is not None and getattr(session, "used", False):
+                handler_db_seconds.inc(name, session.db_time)
+            current_handler.reset(token)
+
+
+class RequestMetricsMiddleware(BaseRequestMiddleware):
+    """Bot session middleware recording count, latency and 429s of API calls."""
+
+    async def __call__(self, make_request, bot: Bot, method):
+        name = type(method).__name__
+        handler_api_calls.inc(current_handler.get())
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            api_retry_after.inc(name)
+            raise
+        except Exception:
+            api_errors.inc(name)
+            raise
+        finally:
+            api_latency.observe(name, time.perf_counter() - started)
+
+
+def instrument_engine(engine):
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def count_statement(*_):
+        handler_statements.inc(current_handler.get())
+
+
+async def metrics_view(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_view)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    logging.info(f"Metrics available on http://{host}:{port}/metrics")
+    return runner
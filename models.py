@@ -1,23 +1,14 @@
 from datetime import datetime
-from sqlalchemy import Column, BigInteger, String, Integer, DateTime, ForeignKey, Boolean
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship
-import os
-from dotenv import load_dotenv
-from config import DATABASE_URL
-
-load_dotenv()
-
-
-engine = create_async_engine(DATABASE_URL, echo=True)
-AsyncSessionLocal = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
-Base = declarative_base()
+from sqlalchemy import Column, BigInteger, String, Integer, DateTime, ForeignKey, Boolean, UniqueConstraint, Index, Enum, text, func
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import relationship
+from database import Base
 
 
 class User(Base):
     __tablename__ = "users"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     telegram_id = Column(BigInteger, unique=True, nullable=False)
     name = Column(String, nullable=False)
     player_games = relationship("PlayerGame", back_populates="player")
@@ -25,8 +16,13 @@ class User(Base):
 
 class Game(Base):
     __tablename__ = "game"
+    __table_args__ = (
+        Index("ix_game_group_id_id", "group_id", "id"),
+        Index("ix_game_active", "id", postgresql_where=text("is_active")),
+        Index("ix_game_ends_at", "ends_at"),
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     time_slot = Column(String, nullable=False)
     is_active = Column(Boolean, default=True)
     player_games = relationship(
@@ -36,15 +32,24 @@ class Game(Base):
         passive_deletes=True,
     )
     group_id = Column(BigInteger, nullable=False)
+    starts_at = Column(DateTime(timezone=True), nullable=False)
+    ends_at = Column(DateTime(timezone=True), nullable=False)
+    # The game message in the group, and the same id once it has been pinned
+    message_id = Column(BigInteger, nullable=True)
+    pinned_message_id = Column(BigInteger, nullable=True)
 
 
 class PlayerGame(Base):
     __tablename__ = "player_games"
+    __table_args__ = (
+        UniqueConstraint("game_id", "player_id", name="uq_player_games_game_player"),
+        Index("ix_player_games_player_id", "player_id"),
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     player_id = Column(BigInteger, ForeignKey("users.telegram_id", ondelete="CASCADE"),
                        nullable=False)
-    status = Column(String, nullable=False)
+    status = Column(Enum("joined", "declined", name="player_status"), nullable=False)
     game_id = Column(Integer, ForeignKey("game.id", ondelete="CASCADE"), nullable=False)
     player = relationship("User", back_populates="player_games")
     game = relationship("Game", back_populates="player_games")
@@ -57,6 +62,89 @@ class Group(Base):
     title = Column(String, nullable=False)
 
 
-async def get_db():
-    async with AsyncSessionLocal() as session:
-        yield session
+class FsmState(Base):
+    __tablename__ = "fsm_states"
+
+    key = Column(String, primary_key=True)
+    state = Column(String, nullable=True)
+    data = Column(JSONB, nullable=False, default=dict)
+    updated_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class DelayedJob(Base):
+    __tablename__ = "delayed_jobs"
+
+    id = Column(Integer, primary_key=True)
+    action = Column(String, nullable=False)
+    kwargs = Column(JSONB, nullable=False, default=dict)
+    run_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    # The process whose scheduler holds the job, see jobs.process_name
+    owner = Column(String, nullable=True, index=True)
+
+
+class NotificationOutbox(Base):
+    """Vote events waiting to be sent to the admin as a digest."""
+    __tablename__ = "notification_outbox"
+
+    id = Column(Integer, primary_key=True)
+    game_id = Column(Integer, ForeignKey("game.id", ondelete="CASCADE"), nullable=False)
+    time_slot = Column(String, nullable=False)
+    player_id = Column(BigInteger, nullable=False)
+    player_name = Column(String, nullable=False)
+    status = Column(Enum("joined", "declined", name="player_status"), nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    attempts = Column(Integer, nullable=False, server_default="0")
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), index=True)
+
+
+class GameArchive(Base):
+    __tablename__ = "game_archive"
+
+    id = Column(Integer, primary_key=True)
+    time_slot = Column(String, nullable=False)
+    group_id = Column(BigInteger, nullable=False)
+    starts_at = Column(DateTime(timezone=True), nullable=False)
+    ends_at = Column(DateTime(timezone=True), nullable=False)
+    archived_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+
+class PlayerGameArchive(Base):
+    __tablename__ = "player_games_archive"
+
+    id = Column(Integer, primary_key=True)
+    game_id = Column(Integer, nullable=False, index=True)
+    player_id = Column(BigInteger, nullable=False)
+    status = Column(Enum("joined", "declined", name="player_status"), nullable=False)
+
+
+class BroadcastJob(Base):
+    """A game announcement sent to every group, see broadcast_jobs.py."""
+    __tablename__ = "broadcast_jobs"
+
+    id = Column(Integer, primary_key=True)
+    time_slot = Column(String, nullable=False)
+    status = Column(Enum("running", "done", name="broadcast_status"), nullable=False, server_default="running")
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    # The process sending it, which renews heartbeat_at while it is alive
+    owner = Column(String, nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+
+class BroadcastDelivery(Base):
+    """Delivery state of a broadcast job in one group."""
+    __tablename__ = "broadcast_deliveries"
+    __table_args__ = (
+        Index("ix_broadcast_deliveries_pending", "job_id", postgresql_where=text("status = 'pending'")),
+    )
+
+    job_id = Column(Integer, ForeignKey("broadcast_jobs.id", ondelete="CASCADE"), primary_key=True)
+    group_id = Column(BigInteger, primary_key=True)
+    game_id = Column(Integer, ForeignKey("game.id", ondelete="CASCADE"), nullable=False)
+    status = Column(Enum("pending", "sent", "failed", name="delivery_status"), nullable=False,
+                    server_default="pending")
+    message_id = Column(BigInteger, nullable=True)
+    error = Column(String, nullable=True)
+    # How the failure is handled once the job is done, see broadcast_jobs.prune_groups
+    permanent = Column(Boolean, nullable=False, server_default="false")
+    migrate_to_chat_id = Column(BigInteger, nullable=True)
@@ -0,0 +1,150 @@
+import html
+import logging
+from datetime import datetime, timedelta, timezone
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from sqlalchemy import delete, select, update
+
+from config import ADMIN_ID, NOTIFY_BATCH_SIZE, NOTIFY_INTERVAL, NOTIFY_MAX_ATTEMPTS, NOTIFY_MAX_BACKOFF
+from models import NotificationOutbox
+
+MESSAGE_LIMIT = 4096
+# Claimed events are due again after this long, in case the process dies while sending them
+CLAIM_TIMEOUT = 300
+
+
+def render_digest(time_slot: str, votes: dict) -> str:
+    """One game's section of the digest, votes is {player_id: (name, status)}."""
+    # The digest is sent in HTML parse mode, a single "<" in a name would fail the whole message
+    joined = [html.escape(name) for name, status in votes.values() if status == "joined"]
+    declined = [html.escape(name) for name, status in votes.values() if status == "declined"]
+    lines = [f"🎮 Game at {html.escape(time_slot)}"]
+    if joined:
+        lines.append(f"✅ Joined ({len(joined)}): {', '.join(joined)}")
+    if declined:
+        lines.append(f"❌ Declined ({len(declined)}): {', '.join(declined)}")
+    return "\n".join(lines)
+
+
+def truncate(text: str, limit: int) -> str:
+    """Cut HTML text to `limit` characters without splitting an escaped entity."""
+    text = text[:limit]
+    amp = text.rfind("&")
+    if amp > text.rfind(";"):
+        text = text[:amp]
+    return text
+
+
+class AdminNotifier:
+    """
+    Sends the vote events queued in notification_outbox to the admin.
+
+    `dispatch` runs periodically, claims everything that is due and turns it
+    into per-game digests, packed into as few messages as fit. Rows are
+    deleted once their message is sent; on failure they are retried with an
+    exponential backoff and dropped after NOTIFY_MAX_ATTEMPTS. Flood control
+    pauses the whole dispatcher for its retry_after, unsent digests included.
+    """
+
+    def __init__(self, bot: Bot, session_factory, chat_id: int = ADMIN_ID):
+        self.bot = bot
+        self.session_factory = session_factory
+        self.chat_id = chat_id
+        self._paused_until = None
+
+    async def dispatch(self):
+        now = datetime.now(timezone.utc)
+        if self._paused_until is not None and now < self._paused_until:
+            return
+        async with self.session_factory() as session:
+            # Claimed by pushing them out of the due window and committed before sending, so no
+            # transaction is held open across the sends. SKIP LOCKED lets runs overlap safely.
+            due = (
+                select(NotificationOutbox.id)
+                .where(NotificationOutbox.next_attempt_at <= now)
+                .order_by(NotificationOutbox.id)
+                .limit(NOTIFY_BATCH_SIZE)
+                .with_for_update(skip_locked=True)
+            )
+            result = await session.scalars(
+                update(NotificationOutbox)
+                .where(NotificationOutbox.id.in_(due))
+                .values(next_attempt_at=now + timedelta(seconds=CLAIM_TIMEOUT))
+                .returning(NotificationOutbox)
+                .execution_options(synchronize_session=False)
+            )
+            events = sorted(result.all(), key=lambda event: event.id)
+            await session.commit()
+        if not events:
+            return
+
+        sent, failed, postponed = [], [], []
+        messages = self._messages(events)
+        for text, batch in messages:
+            try:
+                await self.bot.send_message(self.chat_id, text)
+            except TelegramRetryAfter as e:
+                # Sending the rest now would only extend the flood wait
+                failed.append((batch, e))
+                self._paused_until = datetime.now(timezone.utc) + timedelta(seconds=e.retry_after)
+                postponed = [event.id for _, rest in messages for event in rest]
+                break
+            except Exception as e:
+                failed.append((batch, e))
+            else:
+                sent.extend(event.id for event in batch)
+
+        async with self.session_factory() as session:
+            if sent:
+                await session.execute(delete(NotificationOutbox).where(NotificationOutbox.id.in_(sent)))
+            for batch, error in failed:
+                await self._retry(session, batch, error)
+            if postponed:
+                # Not attempted, so their attempts are left alone
+                await session.execute(
+                    update(NotificationOutbox)
+                    .where(NotificationOutbox.id.in_(postponed))
+                    .values(next_attempt_at=self._paused_until)
+                )
+            await session.commit()
+
+    def _messages(self, events: list):
+        """Yield (text, events) pairs, one section per game and at most MESSAGE_LIMIT characters each."""
+        games = {}
+        for event in events:
+            time_slot, votes, batch = games.setdefault(event.game_id, (event.time_slot, {}, []))
+            # Only the latest vote of a player who changed their mind is shown
+            votes.pop(event.player_id, None)
+            votes[event.player_id] = (event.player_name, event.status)
+            batch.append(event)
+
+        text, batch = "", []
+        for time_slot, votes, game_events in games.values():
+            section = truncate(render_digest(time_slot, votes), MESSAGE_LIMIT)
+            if text and len(text) + len(section) + 2 > MESSAGE_LIMIT:
+                yield text, batch
+                text, batch = "", []
+            text = f"{text}\n\n{section}" if text else section
+            batch.extend(game_events)
+        if text:
+            yield text, batch
+
+    async def _retry(self, session, batch: list, error: Exception):
+        attempts = max(event.attempts for event in batch) + 1
+        ids = [event.id for event in batch]
+        if attempts >= NOTIFY_MAX_ATTEMPTS:
+            logging.error(f"Dropping {len(ids)} admin notifications after {attempts} attempts: {error}")
+            await session.execute(delete(NotificationOutbox).where(NotificationOutbox.id.in_(ids)))
+            return
+
+        if isinstance(error, TelegramRetryAfter):
+            delay = error.retry_after
+        else:
+            delay = min(NOTIFY_MAX_BACKOFF, NOTIFY_INTERVAL * 2 ** attempts)
+        logging.warning(f"Failed to send admin digest (attempt {attempts}), retrying in {delay}s: {error}")
+        await session.execute(
+            update(NotificationOutbox)
+            .where(NotificationOutbox.id.in_(ids))
+            .values(attempts=attempts, next_attempt_at=datetime.now(timezone.utc) + timedelta(seconds=delay))
+        )
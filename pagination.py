@@ -0,0 +1,56 @@
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import ADMIN_PAGE_SIZE
+
+
+@dataclass
+class Page:
+    rows: list
+    # Keys to continue from, None when there is nothing in that direction
+    prev_cursor: Optional[int] = None
+    next_cursor: Optional[int] = None
+
+
+async def fetch_page(session: AsyncSession, query, key, cursor: Optional[int] = None,
+                     direction: str = "next", size: int = ADMIN_PAGE_SIZE) -> Page:
+    """
+    One page of `query` using keyset pagination on the unique column `key`.
+
+    The query must select `key` first. Pages go forward from the row after
+    `cursor`, or backwards from the row before it when direction is "prev",
+    so every page costs an index range scan of `size + 1` rows, however deep.
+    """
+    if direction == "prev":
+        query = query.where(key < cursor).order_by(key.desc())
+    else:
+        if cursor is not None:
+            query = query.where(key > cursor)
+        query = query.order_by(key)
+
+    result = await session.execute(query.limit(size + 1))
+    rows = result.all()
+    has_more = len(rows) > size
+    rows = rows[:size]
+    if not rows:
+        return Page(rows)
+
+    if direction == "prev":
+        rows.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = cursor is not None, has_more
+
+    return Page(
+        rows,
+        prev_cursor=rows[0][0] if has_prev else None,
+        next_cursor=rows[-1][0] if has_next else None,
+    )
+
+
+def parse_cursor(callback_data: str) -> tuple:
+    """Split "<prefix>_<direction>_<cursor>" callback data into (cursor, direction)."""
+    *_, direction, cursor = callback_data.split("_")
+    return int(cursor), direction
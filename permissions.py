@@ -0,0 +1,89 @@
+from dataclasses import dataclass
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNotFound
+from aiogram.types import ChatMember
+
+from cache import LRUCache
+from config import CHAT_PERMISSION_CACHE_SIZE, CHAT_PERMISSION_TTL
+
+ADMIN_STATUSES = ("administrator", "creator")
+
+# Bad requests after which a group will never accept our messages again
+PERMANENT_ERRORS = ("chat not found", "bot was kicked", "bot is not a member", "have no rights to send")
+
+
+@dataclass
+class BotRights:
+    is_admin: bool
+    can_pin: bool
+
+
+def rights_from_member(member: ChatMember) -> BotRights:
+    if member.status == "creator":
+        return BotRights(is_admin=True, can_pin=True)
+    if member.status == "administrator":
+        return BotRights(is_admin=True, can_pin=bool(getattr(member, "can_pin_messages", True)))
+    return BotRights(is_admin=False, can_pin=False)
+
+
+def is_permanent_failure(error: Exception) -> bool:
+    """True if sending to the chat failed in a way that retrying won't fix."""
+    if isinstance(error, (TelegramForbiddenError, TelegramNotFound)):
+        return True
+    return isinstance(error, TelegramBadRequest) and any(
+        reason in error.message.lower() for reason in PERMANENT_ERRORS
+    )
+
+
+class ChatPermissions:
+    """
+    The bot's rights in each group.
+
+    Entries come from my_chat_member updates, or from getChatMember when
+    nothing fresh is known, and are revalidated after `ttl` seconds.
+
+    With several workers (see supervisor.py) a group's my_chat_member
+    updates only reach that group's worker, so `all_chats` is False there:
+    `is_admin`, asked from the group itself, still uses the cache, but
+    `get` and `lacking_admin`, asked about other groups from the admin's
+    chat, know nothing and every group is tried.
+    """
+
+    def __init__(self, maxsize: int = CHAT_PERMISSION_CACHE_SIZE, ttl: float = CHAT_PERMISSION_TTL,
+                 all_chats: bool = True):
+        self._rights = LRUCache(maxsize, ttl)
+        self.all_chats = all_chats
+
+    def update(self, chat_id: int, member: ChatMember):
+        self._rights.set(chat_id, rights_from_member(member))
+
+    def revoke_pin(self, chat_id: int):
+        rights = self._rights.get(chat_id)
+        if rights is not None:
+            rights.can_pin = False
+
+    def forget(self, chat_id: int):
+        self._rights.pop(chat_id)
+
+    def get(self, chat_id: int):
+        """Cached rights, or None if they are unknown or stale."""
+        if not self.all_chats:
+            return None
+        return self._rights.get(chat_id)
+
+    async def is_admin(self, bot: Bot, chat_id: int) -> bool:
+        rights = self._rights.get(chat_id)
+        if rights is None:
+            rights = rights_from_member(await bot.get_chat_member(chat_id, bot.id))
+            self._rights.set(chat_id, rights)
+        return rights.is_admin
+
+    def lacking_admin(self) -> list:
+        """Chats where the bot is known not to be an admin."""
+        if not self.all_chats:
+            return []
+        return [
+            chat_id for chat_id in self._rights.keys()
+            if (rights := self._rights.get(chat_id)) is not None and not rights.is_admin
+        ]
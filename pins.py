@@ -0,0 +1,118 @@
+import asyncio
+import logging
+from collections import defaultdict
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNotFound
+from aiogram.methods import PinChatMessage, UnpinChatMessage
+from sqlalchemy import select, update
+
+from broadcast import Broadcaster
+from config import PIN_MAX_ATTEMPTS, PIN_RETRY_DELAY
+from models import Game
+from permissions import ChatPermissions
+
+# Errors retrying won't fix: missing rights, the message or chat is gone, or the bot was removed
+PERMANENT_ERRORS = (TelegramBadRequest, TelegramForbiddenError, TelegramNotFound)
+
+
+class PinPipeline:
+    """
+    Pins the messages of newly scheduled games after the broadcast is done.
+
+    For every group the previous game's pinned message is unpinned and the
+    new one pinned, through the broadcaster's rate limits. Transient
+    failures are retried with an exponential backoff. Pinned message ids
+    are stored on the games, so they can be unpinned later.
+    """
+
+    def __init__(self, broadcaster: Broadcaster, session_factory, permissions: ChatPermissions,
+                 max_attempts: int = PIN_MAX_ATTEMPTS, retry_delay: float = PIN_RETRY_DELAY):
+        self.broadcaster = broadcaster
+        self.session_factory = session_factory
+        self.permissions = permissions
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._tasks = set()
+
+    def schedule(self, messages: dict, games: dict):
+        """Pin in the background, messages is {group_id: message_id} and games {group_id: game_id}."""
+        task = asyncio.create_task(self.run(messages, games))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def drain(self):
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def run(self, messages: dict, games: dict):
+        try:
+            await self._run(messages, games)
+        except Exception:
+            logging.exception("Pinning game messages failed")
+
+    async def _run(self, messages: dict, games: dict):
+        async with self.session_factory() as session:
+            result = await session.execute(
+                select(Game.group_id, Game.id, Game.pinned_message_id)
+                .where(
+                    Game.group_id.in_(list(messages)),
+                    Game.pinned_message_id.is_not(None),
+                    Game.id.not_in(list(games.values())),
+                )
+            )
+            stale = defaultdict(list)
+            for group_id, game_id, message_id in result.all():
+                stale[group_id].append((game_id, message_id))
+
+        # game_id -> pinned message id, None once unpinned
+        changes = {}
+
+        async def replace_pin(chat_id: int):
+            for game_id, message_id in stale[chat_id]:
+                try:
+                    if await self._attempt(chat_id, UnpinChatMessage(chat_id=chat_id, message_id=message_id)):
+                        changes[game_id] = None
+                except PERMANENT_ERRORS as e:
+                    # Most likely unpinned or deleted by the group admins already
+                    logging.info(f"Could not unpin message {message_id} in chat {chat_id}: {e}")
+                    changes[game_id] = None
+
+            rights = self.permissions.get(chat_id)
+            if rights is not None and not rights.can_pin:
+                return
+            pin = PinChatMessage(chat_id=chat_id, message_id=messages[chat_id], disable_notification=True)
+            try:
+                if await self._attempt(chat_id, pin):
+                    changes[games[chat_id]] = messages[chat_id]
+            except PERMANENT_ERRORS as e:
+                logging.warning(f"Failed to pin the game message in group {chat_id}: {e}")
+                if isinstance(e, TelegramBadRequest):
+                    self.permissions.revoke_pin(chat_id)
+
+        result = await self.broadcaster.run(messages, replace_pin)
+        if changes:
+            async with self.session_factory() as session:
+                await session.execute(update(Game), [
+                    {"id": game_id, "pinned_message_id": message_id} for game_id, message_id in changes.items()
+                ])
+                await session.commit()
+
+        pinned = sum(1 for message_id in changes.values() if message_id is not None)
+        logging.info(f"Pinned {pinned} of {result.total} game messages")
+
+    async def _attempt(self, chat_id: int, method) -> bool:
+        """
+        Call `method`, retrying transient failures with a backoff. Returns
+        whether it succeeded, permanent failures are raised.
+        """
+        for attempt in range(self.max_attempts):
+            try:
+                await self.broadcaster.call(chat_id, method)
+                return True
+            except PERMANENT_ERRORS:
+                raise
+            except Exception as e:
+                delay = self.retry_delay * 2 ** attempt
+                logging.warning(f"{type(method).__name__} in chat {chat_id} failed, retrying in {delay}s: {e}")
+                await asyncio.sleep(delay)
+        return False
@@ -0,0 +1,86 @@
+import asyncio
+from dataclasses import dataclass, field
+
+from sqlalchemy import select
+
+from cache import LRUCache
+from config import ROSTER_CACHE_SIZE, ROSTER_CACHE_TTL
+from models import User, PlayerGame
+
+
+@dataclass
+class Roster:
+    joined: dict = field(default_factory=dict)
+    declined: dict = field(default_factory=dict)
+    version: int = 0
+    # (version, text) of the last rendered game message
+    rendered: tuple = field(default=None, repr=False)
+
+    def apply(self, player_id: int, name: str, status: str):
+        self.joined.pop(player_id, None)
+        self.declined.pop(player_id, None)
+        if status == "joined":
+            self.joined[player_id] = name
+        else:
+            self.declined[player_id] = name
+        self.version += 1
+
+
+class RosterStore:
+    """
+    In-memory rosters of games, keyed by game_id.
+
+    A roster is read from the database the first time it is needed and then
+    kept up to date by `apply` on every vote, so rendering a game message
+    does not query the database. Rosters of finished games fall out through
+    LRU/TTL eviction or `discard`.
+    """
+
+    def __init__(self, session_factory, maxsize: int = ROSTER_CACHE_SIZE, ttl: float = ROSTER_CACHE_TTL):
+        self.session_factory = session_factory
+        self._rosters = LRUCache(maxsize, ttl)
+        self._loading = {}
+        self._missed = {}
+
+    async def get(self, game_id: int) -> Roster:
+        roster = self._rosters.get(game_id)
+        if roster is not None:
+            return roster
+
+        task = self._loading.get(game_id)
+        if task is None:
+            task = self._loading[game_id] = asyncio.create_task(self._load(game_id))
+            self._missed[game_id] = []
+        return await asyncio.shield(task)
+
+    async def _load(self, game_id: int) -> Roster:
+        try:
+            async with self.session_factory() as session:
+                result = await session.execute(
+                    select(PlayerGame.player_id, User.name, PlayerGame.status)
+                    .join(User, User.telegram_id == PlayerGame.player_id)
+                    .where(PlayerGame.game_id == game_id)
+                    .order_by(PlayerGame.id)
+                )
+            roster = Roster()
+            for player_id, name, status in result.all():
+                roster.apply(player_id, name, status)
+            # Votes that arrived while the query was running may be missing from its snapshot
+            for vote in self._missed.get(game_id, ()):
+                roster.apply(*vote)
+            self._rosters.set(game_id, roster)
+            return roster
+        finally:
+            self._loading.pop(game_id, None)
+            self._missed.pop(game_id, None)
+
+    def apply(self, game_id: int, player_id: int, name: str, status: str):
+        """Apply a committed vote. Rosters that are not loaded yet will pick it up from the database."""
+        if game_id in self._missed:
+            self._missed[game_id].append((player_id, name, status))
+        roster = self._rosters.get(game_id)
+        if roster is not None:
+            roster.apply(player_id, name, status)
+
+    def discard(self, game_id: int):
+        self._rosters.pop(game_id)
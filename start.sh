@@ -12,20 +12,9 @@ stop_bot() {
 # Trap SIGTERM
 trap stop_bot SIGTERM
 
-# Wait for PostgreSQL
-until python -c "import psycopg2; psycopg2.connect(host='${DB_HOST}', port=${DB_PORT}, user='${DB_USER}', password='${DB_PASSWORD}', dbname='${DB_NAME}')" 2>/dev/null; do
-  echo "Waiting for PostgreSQL to be ready..."
-  sleep 2
-done
-
-# Run migrations (check for /app/alembic)
-if [ -d "/app/alembic" ]; then
-    echo "Running Alembic migrations..."
-    alembic upgrade head
-else
-    echo "No alembic folder found at /app/alembic"
-    ls -la /app
-fi
+# The bot waits for PostgreSQL and runs the Alembic migrations itself,
+# in the same interpreter instead of a psycopg2 probe loop and a separate alembic run
+export RUN_MIGRATIONS="${RUN_MIGRATIONS:-true}"
 
 # Start the bot in background
 echo "Starting the Telegram bot..."
@@ -33,4 +22,4 @@ python main.py &
 pid=$!
 
 # Wait for the bot process
-wait "$pid"
\ No newline at end of file
+wait "$pid"
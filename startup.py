@@ -0,0 +1,124 @@
+"""
+Startup helpers: database readiness, migrations and the --profile-startup
+report. Kept free of project imports so main.py can enable the profiler
+before anything else is imported.
+"""
+import asyncio
+import builtins
+import importlib.util
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+class StartupProfiler:
+    """
+    Records how long each module takes to import (excluding the modules it
+    imports itself) and how long each startup phase takes.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.imports = {}
+        self.phases = []
+        self._stack = []
+        self._import = builtins.__import__
+
+    def enable(self):
+        builtins.__import__ = self._timed_import
+
+    def disable(self):
+        builtins.__import__ = self._import
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        module = name
+        if level:
+            try:
+                module = importlib.util.resolve_name("." * level + name, (globals or {}).get("__package__"))
+            except (ImportError, ValueError):
+                return self._import(name, globals, locals, fromlist, level)
+        if not module or module in sys.modules:
+            return self._import(name, globals, locals, fromlist, level)
+
+        self._stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - started
+            children = self._stack.pop()
+            self.imports[module] = self.imports.get(module, 0.0) + elapsed - children
+            if self._stack:
+                self._stack[-1] += elapsed
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started))
+
+    def report(self, limit: int = 25) -> str:
+        total = time.perf_counter() - self.started
+        imports = sorted(self.imports.items(), key=lambda item: item[1], reverse=True)
+        lines = [f"Startup took {total * 1000:.0f} ms, {sum(self.imports.values()) * 1000:.0f} ms of it importing"]
+        lines.append(f"\n{'phase':<40}{'ms':>10}")
+        lines.extend(f"{name:<40}{elapsed * 1000:>10.1f}" for name, elapsed in self.phases)
+        lines.append(f"\n{'module (self time)':<40}{'ms':>10}")
+        lines.extend(f"{name:<40}{elapsed * 1000:>10.1f}" for name, elapsed in imports[:limit])
+        return "\n".join(lines)
+
+
+class _NoProfiler:
+    @contextmanager
+    def phase(self, name: str):
+        yield
+
+
+profiler = _NoProfiler()
+
+
+def enable_profiler():
+    global profiler
+    profiler = StartupProfiler()
+    profiler.enable()
+    return profiler
+
+
+async def wait_for_database(url: str, timeout: float):
+    """Block until Postgres accepts connections, probing with asyncpg in this process."""
+    import asyncpg
+
+    dsn = url.replace("postgresql+asyncpg://", "postgresql://")
+    deadline = time.monotonic() + timeout
+    delay = 0.2
+    while True:
+        try:
+            conn = await asyncpg.connect(dsn, timeout=5)
+        except (OSError, asyncpg.PostgresError, asyncio.TimeoutError) as e:
+            if time.monotonic() + delay > deadline:
+                raise RuntimeError(f"Database not ready after {timeout}s: {e}") from e
+            logging.info(f"Waiting for PostgreSQL to be ready... ({e})")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 2)
+        else:
+            try:
+                await conn.execute("SELECT 1")
+            finally:
+                await conn.close()
+            return
+
+
+def run_migrations():
+    """alembic upgrade head, without starting another interpreter."""
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config(os.path.join(ROOT, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(ROOT, "alembic"))
+    command.upgrade(config, "head")
@@ -0,0 +1,337 @@
+"""
+Multi-process mode, enabled with WORKERS > 1.
+
+The supervisor process only receives updates (polling or webhook) and
+forwards the raw JSON to one of the worker processes, picked by hashing the
+update's chat id. All updates of a chat therefore reach the same worker,
+which processes them one after another while different chats run
+concurrently. Updates waiting for their chat's previous one don't count
+against WORKER_CONCURRENCY; reading pauses while one chat has
+WORKER_CHAT_BACKLOG updates waiting or the worker WORKER_QUEUE_SIZE in
+total. Every worker has its own bot session, dispatcher, caches and
+database pool; worker 0 is the primary and also runs the periodic jobs.
+
+On SIGTERM/SIGINT the supervisor stops receiving, tells every worker to
+finish what is queued and waits for them to exit.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import secrets
+import signal
+import time
+
+import aiohttp
+from aiohttp import web
+
+from config import (
+    BOT_MODE,
+    BOT_TOKEN,
+    METRICS_PORT,
+    WEBAPP_HOST,
+    WEBAPP_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_URL,
+    WORKER_CHAT_BACKLOG,
+    WORKER_CONCURRENCY,
+    WORKER_QUEUE_SIZE,
+    WORKER_SHUTDOWN_TIMEOUT,
+    WORKERS,
+)
+
+API_URL = f"https://api.telegram.org/bot{BOT_TOKEN}"
+POLLING_TIMEOUT = 30
+READY_TIMEOUT = 120
+
+
+def chat_id_of(update: dict) -> int:
+    """The chat an update belongs to, or the user for updates without a chat."""
+    for value in update.values():
+        if not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        user = value.get("from") or value.get("user")
+        if user:
+            return user["id"]
+    return 0
+
+
+def allowed_updates() -> list:
+    from handlers import router
+    return router.resolve_used_update_types()
+
+
+# Worker process --------------------------------------------------------
+
+def run_worker(index: int, updates: multiprocessing.Queue, ready: multiprocessing.Queue, parent_pid: int,
+               replaces: str = None):
+    # Shutdown is driven by the supervisor, a Ctrl+C reaching the whole process group must not kill us
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO, format=f"[worker {index}] %(levelname)s:%(name)s:%(message)s")
+    asyncio.run(worker_main(index, updates, ready, parent_pid, replaces))
+
+
+def next_update(updates: multiprocessing.Queue, parent_pid: int):
+    """Block until an update arrives, None once the supervisor asks us to stop or is gone."""
+    while True:
+        try:
+            return updates.get(timeout=1)
+        except queue.Empty:
+            if os.getppid() != parent_pid:
+                logging.error("Supervisor is gone, stopping")
+                return None
+
+
+async def worker_main(index: int, updates: multiprocessing.Queue, ready: multiprocessing.Queue, parent_pid: int,
+                      replaces: str = None):
+    from aiogram.types import Update
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+    from main import create_bot, create_dispatcher, start_services, shutdown
+
+    bot = create_bot()
+    scheduler = AsyncIOScheduler()
+    dp = create_dispatcher(bot, scheduler)
+    metrics_runner = await start_services(
+        bot, dp, scheduler,
+        primary=index == 0,
+        metrics_port=METRICS_PORT + index if METRICS_PORT else None,
+        replaces=replaces,
+    )
+    await dp.emit_startup(bot=bot)
+    ready.put(index)
+    logging.info("Worker started")
+
+    loop = asyncio.get_running_loop()
+    # Bounds the updates being handled, not the ones waiting for their chat's previous update
+    semaphore = asyncio.Semaphore(WORKER_CONCURRENCY)
+    # chat id -> task processing the latest update of that chat
+    chains = {}
+    # chat id -> updates of that chat accepted but not processed yet, and their total
+    backlog = {}
+    waiting = 0
+    progressed = asyncio.Condition()
+
+    async def process(previous, chat_id: int, update: Update):
+        nonlocal waiting
+        try:
+            if previous is not None:
+                await asyncio.wait({previous})
+            async with semaphore:
+                await dp.feed_update(bot, update)
+        except Exception as e:
+            logging.error(f"Failed to process update {update.update_id}: {e}", exc_info=True)
+        finally:
+            waiting -= 1
+            backlog[chat_id] -= 1
+            if not backlog[chat_id]:
+                del backlog[chat_id]
+            async with progressed:
+                progressed.notify_all()
+
+    def forget(chat_id: int, task: asyncio.Task):
+        if chains.get(chat_id) is task:
+            del chains[chat_id]
+
+    try:
+        while True:
+            raw = await loop.run_in_executor(None, next_update, updates, parent_pid)
+            if raw is None:
+                break
+            chat_id = chat_id_of(raw)
+            # A flooded chat, or too much queued overall, pauses reading instead of queueing without bound
+            async with progressed:
+                await progressed.wait_for(
+                    lambda: backlog.get(chat_id, 0) < WORKER_CHAT_BACKLOG
+                    and waiting < WORKER_QUEUE_SIZE
+                )
+            waiting += 1
+            backlog[chat_id] = backlog.get(chat_id, 0) + 1
+            update = Update.model_validate(raw, context={"bot": bot})
+            task = asyncio.create_task(process(chains.get(chat_id), chat_id, update))
+            chains[chat_id] = task
+            task.add_done_callback(lambda t, chat_id=chat_id: forget(chat_id, t))
+
+        logging.info(f"Finishing {len(chains)} chats in progress...")
+        await asyncio.gather(*chains.values(), return_exceptions=True)
+    finally:
+        await dp.emit_shutdown(bot=bot)
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await shutdown(bot, dp, scheduler)
+
+
+# Supervisor process ----------------------------------------------------
+
+class Supervisor:
+    """Starts the workers, routes updates to them and restarts any that die."""
+
+    def __init__(self, workers: int = WORKERS):
+        self._context = multiprocessing.get_context("spawn")
+        self._queues = [self._context.Queue(WORKER_QUEUE_SIZE) for _ in range(workers)]
+        self._ready = self._context.Queue()
+        self._processes = [None] * workers
+        self._stopping = False
+
+    def _spawn(self, index: int, replaces: str = None):
+        process = self._context.Process(
+            target=run_worker,
+            args=(index, self._queues[index], self._ready, os.getpid(), replaces),
+            name=f"worker-{index}",
+        )
+        process.start()
+        self._processes[index] = process
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        # The primary restores delayed jobs before the others can create new ones
+        self._spawn(0)
+        await loop.run_in_executor(None, self._ready.get, True, READY_TIMEOUT)
+        for index in range(1, len(self._processes)):
+            self._spawn(index)
+        for _ in range(1, len(self._processes)):
+            await loop.run_in_executor(None, self._ready.get, True, READY_TIMEOUT)
+        logging.info(f"{len(self._processes)} workers ready")
+
+    async def route(self, update: dict):
+        updates = self._queues[chat_id_of(update) % len(self._queues)]
+        try:
+            updates.put_nowait(update)
+        except queue.Full:
+            # The worker is behind, wait for it instead of buffering without bound
+            await asyncio.get_running_loop().run_in_executor(None, updates.put, update)
+
+    async def watch(self):
+        """Restart workers that exit while we are not stopping."""
+        from jobs import process_name
+
+        while not self._stopping:
+            for index, process in enumerate(self._processes):
+                if not process.is_alive() and not self._stopping:
+                    logging.error(f"Worker {index} exited with code {process.exitcode}, restarting")
+                    # The new worker takes over the dead one's delayed jobs, not everybody's
+                    self._spawn(index, replaces=process_name(process.pid))
+            await asyncio.sleep(1)
+
+    async def stop(self):
+        self._stopping = True
+        for updates in self._queues:
+            updates.put(None)
+
+        # All workers shut down at once, within a single WORKER_SHUTDOWN_TIMEOUT
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + WORKER_SHUTDOWN_TIMEOUT
+
+        def join(process):
+            process.join(max(0, deadline - time.monotonic()))
+
+        await asyncio.gather(*(loop.run_in_executor(None, join, process) for process in self._processes))
+        for index, process in enumerate(self._processes):
+            if process.is_alive():
+                logging.warning(f"Worker {index} did not stop in {WORKER_SHUTDOWN_TIMEOUT}s, terminating")
+                process.terminate()
+        await asyncio.gather(*(loop.run_in_executor(None, process.join) for process in self._processes))
+
+
+async def call_api(http: aiohttp.ClientSession, method: str, **params):
+    async with http.post(f"{API_URL}/{method}", json=params) as response:
+        payload = await response.json()
+    if not payload.get("ok"):
+        raise RuntimeError(f"{method} failed: {payload.get('description')}")
+    return payload["result"]
+
+
+async def poll_updates(supervisor: Supervisor, stop_event: asyncio.Event):
+    timeout = aiohttp.ClientTimeout(total=POLLING_TIMEOUT + 10)
+    async with aiohttp.ClientSession(timeout=timeout) as http:
+        await call_api(http, "deleteWebhook")
+        params = {"timeout": POLLING_TIMEOUT, "allowed_updates": allowed_updates()}
+        stopped = asyncio.create_task(stop_event.wait())
+        backoff = 1
+        logging.info("Polling for updates")
+
+        while not stop_event.is_set():
+            request = asyncio.create_task(call_api(http, "getUpdates", **params))
+            await asyncio.wait({request, stopped}, return_when=asyncio.FIRST_COMPLETED)
+            if not request.done():
+                # Unconfirmed updates are delivered again after a restart
+                request.cancel()
+                break
+
+            try:
+                updates = request.result()
+            except Exception as e:
+                logging.error(f"getUpdates failed, retrying in {backoff}s: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+                continue
+
+            backoff = 1
+            for update in updates:
+                await supervisor.route(update)
+                params["offset"] = update["update_id"] + 1
+
+        stopped.cancel()
+        if "offset" in params:
+            # Confirm the updates routed last, otherwise Telegram delivers them again after a restart
+            try:
+                await call_api(http, "getUpdates", offset=params["offset"], limit=1, timeout=0)
+            except Exception as e:
+                logging.error(f"Failed to confirm the last updates: {e}")
+
+
+async def serve_webhook(supervisor: Supervisor, stop_event: asyncio.Event):
+    secret_token = WEBHOOK_SECRET
+    if not secret_token:
+        secret_token = secrets.token_urlsafe(32)
+        logging.warning("WEBHOOK_SECRET is not set, using a random secret token for this run")
+
+    async def receive(request: web.Request) -> web.Response:
+        if request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret_token:
+            return web.Response(status=401)
+        await supervisor.route(await request.json())
+        return web.json_response({})
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, receive)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=WEBAPP_HOST, port=WEBAPP_PORT)
+    await site.start()
+
+    async with aiohttp.ClientSession() as http:
+        await call_api(
+            http, "setWebhook",
+            url=f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+            secret_token=secret_token,
+            allowed_updates=allowed_updates(),
+        )
+    logging.info(f"Webhook server listening on {WEBAPP_HOST}:{WEBAPP_PORT}{WEBHOOK_PATH}")
+
+    try:
+        await stop_event.wait()
+    finally:
+        await site.stop()
+        await runner.cleanup()
+
+
+async def run_supervisor(stop_event: asyncio.Event):
+    """Run WORKERS worker processes fed by this process until `stop_event` is set."""
+    supervisor = Supervisor()
+    await supervisor.start()
+    watcher = asyncio.create_task(supervisor.watch())
+    try:
+        if BOT_MODE == "webhook":
+            await serve_webhook(supervisor, stop_event)
+        else:
+            await poll_updates(supervisor, stop_event)
+    finally:
+        logging.info("Stopping workers...")
+        watcher.cancel()
+        await supervisor.stop()
+        logging.info("Shutdown complete")
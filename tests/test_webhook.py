@@ -0,0 +1,185 @@
+"""
+webhook.run_webhook against a local fake Bot API server, which only has to
+answer setWebhook. Updates are posted to the webhook like Telegram would.
+"""
+import asyncio
+import socket
+
+import aiohttp
+from aiogram import Bot, Dispatcher, Router
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiohttp import web
+
+import webhook
+
+SECRET = "s3cret"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def message_update(update_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": 100 + update_id, "type": "private"},
+            "from": {"id": 100 + update_id, "is_bot": False, "first_name": "Player"},
+            "text": "hello",
+        },
+    }
+
+
+class FakeTelegram:
+    """A Bot API server that records the methods called and answers them with True."""
+
+    def __init__(self):
+        self.calls = []
+        self.app = web.Application()
+        self.app.router.add_post("/bot{token}/{method}", self.handle)
+        self.runner = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.calls.append((request.match_info["method"], dict(await request.post())))
+        return web.json_response({"ok": True, "result": True})
+
+    async def start(self) -> str:
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        port = free_port()
+        await web.TCPSite(self.runner, "127.0.0.1", port).start()
+        return f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+class Harness:
+    """run_webhook with a dispatcher whose message handler blocks until `release` is set."""
+
+    def __init__(self, monkeypatch, concurrency: int = 100):
+        self.port = free_port()
+        monkeypatch.setattr(webhook, "WEBAPP_HOST", "127.0.0.1")
+        monkeypatch.setattr(webhook, "WEBAPP_PORT", self.port)
+        monkeypatch.setattr(webhook, "WEBHOOK_URL", "https://example.com")
+        monkeypatch.setattr(webhook, "WEBHOOK_SECRET", SECRET)
+        monkeypatch.setattr(webhook, "WEBHOOK_CONCURRENCY", concurrency)
+
+        self.telegram = FakeTelegram()
+        self.stop_event = asyncio.Event()
+        self.release = asyncio.Event()
+        self.started = []
+        self.finished = []
+
+        router = Router()
+
+        @router.message()
+        async def on_message(message):
+            self.started.append(message.message_id)
+            await self.release.wait()
+            self.finished.append(message.message_id)
+
+        self.dp = Dispatcher()
+        self.dp.include_router(router)
+
+    async def __aenter__(self):
+        api = await self.telegram.start()
+        self.bot = Bot("123456:TEST", session=AiohttpSession(api=TelegramAPIServer.from_base(api)))
+        self.server = asyncio.create_task(webhook.run_webhook(self.bot, self.dp, self.stop_event))
+        self.http = aiohttp.ClientSession()
+        while not self.telegram.calls:
+            assert not self.server.done(), self.server.exception()
+            await asyncio.sleep(0.01)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release.set()
+        self.stop_event.set()
+        await asyncio.wait_for(self.server, 5)
+        await self.http.close()
+        await self.bot.session.close()
+        await self.telegram.stop()
+
+    def post(self, update: dict, secret: str = SECRET):
+        return self.http.post(
+            f"http://127.0.0.1:{self.port}{webhook.WEBHOOK_PATH}",
+            json=update,
+            headers={"X-Telegram-Bot-Api-Secret-Token": secret},
+        )
+
+
+async def wait_until(condition, timeout: float = 2):
+    async with asyncio.timeout(timeout):
+        while not condition():
+            await asyncio.sleep(0.01)
+
+
+def test_registers_webhook_with_secret(monkeypatch):
+    async def scenario():
+        async with Harness(monkeypatch) as harness:
+            method, params = harness.telegram.calls[0]
+            assert method == "setWebhook"
+            assert params["url"] == f"https://example.com{webhook.WEBHOOK_PATH}"
+            assert params["secret_token"] == SECRET
+
+    asyncio.run(scenario())
+
+
+def test_wrong_secret_is_rejected(monkeypatch):
+    async def scenario():
+        async with Harness(monkeypatch) as harness:
+            async with harness.post(message_update(1), secret="wrong") as response:
+                assert response.status == 401
+            async with harness.post(message_update(2)) as response:
+                assert response.status == 200
+            await wait_until(lambda: harness.started == [2])
+
+    asyncio.run(scenario())
+
+
+def test_requests_over_the_limit_wait(monkeypatch):
+    async def scenario():
+        async with Harness(monkeypatch, concurrency=2) as harness:
+            async def send(update_id: int) -> int:
+                async with harness.post(message_update(update_id)) as response:
+                    return response.status
+
+            first = [await send(1), await send(2)]
+            assert first == [200, 200]
+            await wait_until(lambda: len(harness.started) == 2)
+
+            # Both permits are taken, the third update is not acknowledged yet
+            third = asyncio.create_task(send(3))
+            await asyncio.sleep(0.2)
+            assert not third.done()
+            assert harness.started == [1, 2]
+
+            harness.release.set()
+            assert await asyncio.wait_for(third, 2) == 200
+            await wait_until(lambda: sorted(harness.finished) == [1, 2, 3])
+
+    asyncio.run(scenario())
+
+
+def test_stop_drains_updates_in_flight(monkeypatch):
+    async def scenario():
+        async with Harness(monkeypatch) as harness:
+            async with harness.post(message_update(1)) as response:
+                assert response.status == 200
+            await wait_until(lambda: harness.started == [1])
+
+            harness.stop_event.set()
+            await asyncio.sleep(0.2)
+            # Still waiting for the update that is being processed
+            assert not harness.server.done()
+
+            harness.release.set()
+            await asyncio.wait_for(harness.server, 2)
+            assert harness.finished == [1]
+
+    asyncio.run(scenario())
@@ -0,0 +1,70 @@
+import asyncio
+from typing import Optional
+
+from sqlalchemy import select
+
+from cache import LRUCache
+from config import USER_CACHE_SIZE, USER_CACHE_TTL, USER_CACHE_NEGATIVE_TTL
+from models import User
+
+# Returned by `UserCache.peek` when nothing is known about the user yet
+MISSING = object()
+
+
+class UserCache:
+    """
+    Registered users by telegram_id.
+
+    Unregistered users are cached too (as None, with a shorter TTL), so
+    repeated taps from them don't reach the database at all.
+    """
+
+    def __init__(self, session_factory, maxsize: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL,
+                 negative_ttl: float = USER_CACHE_NEGATIVE_TTL):
+        self.session_factory = session_factory
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self._users = LRUCache(maxsize, ttl)
+        self._loading = {}
+
+    def peek(self, telegram_id: int):
+        """Return the cached name, None for a known unregistered user or MISSING."""
+        name = self._users.get(telegram_id, MISSING)
+        if name is MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return name
+
+    async def get(self, telegram_id: int) -> Optional[str]:
+        """Return the user's name, or None if they are not registered."""
+        name = self.peek(telegram_id)
+        if name is not MISSING:
+            return name
+
+        task = self._loading.get(telegram_id)
+        if task is None:
+            task = self._loading[telegram_id] = asyncio.create_task(self._load(telegram_id))
+        return await asyncio.shield(task)
+
+    async def _load(self, telegram_id: int) -> Optional[str]:
+        try:
+            async with self.session_factory() as session:
+                result = await session.execute(select(User.name).where(User.telegram_id == telegram_id))
+                name = result.scalar_one_or_none()
+            # Don't overwrite what register_user stored while the query was running
+            if telegram_id not in self._users:
+                self.remember(telegram_id, name)
+            return name
+        finally:
+            self._loading.pop(telegram_id, None)
+
+    def remember(self, telegram_id: int, name: Optional[str]):
+        self._users.set(telegram_id, name, ttl=None if name is not None else self.negative_ttl)
+
+    def invalidate(self, telegram_id: int):
+        self._users.pop(telegram_id)
+
+    def stats(self) -> dict:
+        return {"size": len(self._users), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,80 @@
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import Select, select, func, literal, true
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import User, Game, PlayerGame, NotificationOutbox
+
+
+@dataclass
+class VoteResult:
+    user_name: Optional[str]
+    time_slot: Optional[str]
+    changed: bool
+
+
+async def record_vote(session: AsyncSession, game_id: int, chat_id: int, user_id: int,
+                      status: str) -> VoteResult:
+    """
+    Record a join/decline vote in one round trip.
+
+    The user and the game are looked up in CTEs of the same statement as the
+    upsert, so the caller can tell an unregistered user (`user_name` is None),
+    a finished game or one from another group (`time_slot` is None) and a
+    repeated vote (`changed` is False) apart without any extra query.
+
+    A changed vote also queues an event for the admin digest in the same
+    statement, so the notification commits or rolls back with the vote.
+    """
+    result = await session.execute(vote_statement(game_id, chat_id, user_id, status))
+    user_name, time_slot, changed = result.one()
+    return VoteResult(user_name=user_name, time_slot=time_slot, changed=bool(changed))
+
+
+def vote_statement(game_id: int, chat_id: int, user_id: int, status: str) -> Select:
+    """The statement `record_vote` executes, returning (user name, time slot, changed count)."""
+    user = select(User.name).where(User.telegram_id == user_id).cte("voter")
+    game = (
+        select(Game.id, Game.time_slot)
+        .where(Game.id == game_id, Game.group_id == chat_id, Game.is_active == True)
+        .cte("voted_game")
+    )
+
+    upsert = insert(PlayerGame).from_select(
+        [PlayerGame.game_id, PlayerGame.player_id, PlayerGame.status],
+        select(
+            game.c.id,
+            literal(user_id, PlayerGame.player_id.type),
+            literal(status, PlayerGame.status.type),
+        ).select_from(game.join(user, true())),
+    )
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[PlayerGame.game_id, PlayerGame.player_id],
+        set_={"status": upsert.excluded.status},
+        where=PlayerGame.status != upsert.excluded.status,
+    ).returning(PlayerGame.id).cte("upserted")
+
+    notify = insert(NotificationOutbox).from_select(
+        [
+            NotificationOutbox.game_id,
+            NotificationOutbox.time_slot,
+            NotificationOutbox.player_id,
+            NotificationOutbox.player_name,
+            NotificationOutbox.status,
+        ],
+        select(
+            game.c.id,
+            game.c.time_slot,
+            literal(user_id, NotificationOutbox.player_id.type),
+            user.c.name,
+            literal(status, NotificationOutbox.status.type),
+        ).select_from(upsert.join(game, true()).join(user, true())),
+    ).cte("notified")
+
+    return select(
+        select(user.c.name).scalar_subquery(),
+        select(game.c.time_slot).scalar_subquery(),
+        select(func.count()).select_from(upsert).scalar_subquery(),
+    ).add_cte(notify)
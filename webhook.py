@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import secrets
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from config import (
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_CONCURRENCY,
+    WEBAPP_HOST,
+    WEBAPP_PORT,
+)
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """
+    Webhook handler that processes updates in the background, but with at
+    most `concurrency` of them in flight.
+
+    Once the limit is reached new requests wait before being acknowledged,
+    which makes Telegram back off instead of us piling up tasks.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, concurrency: int = WEBHOOK_CONCURRENCY, **kwargs):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, **kwargs)
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        await self._semaphore.acquire()
+        try:
+            update = await request.json(loads=bot.session.json_loads)
+        except Exception:
+            self._semaphore.release()
+            raise
+
+        task = asyncio.create_task(self._background_feed_update(bot=bot, update=update))
+        self._background_feed_update_tasks.add(task)
+        task.add_done_callback(self._background_feed_update_tasks.discard)
+        task.add_done_callback(lambda _: self._semaphore.release())
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def drain(self):
+        """Wait until every accepted update has been processed."""
+        while self._background_feed_update_tasks:
+            await asyncio.gather(*self._background_feed_update_tasks, return_exceptions=True)
+
+    async def close(self):
+        # The bot session is closed by main.shutdown once everything else has stopped
+        pass
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher, stop_event: asyncio.Event):
+    """Serve updates over a webhook until `stop_event` is set, then drain in-flight updates."""
+    secret_token = WEBHOOK_SECRET
+    if not secret_token:
+        secret_token = secrets.token_urlsafe(32)
+        logging.warning("WEBHOOK_SECRET is not set, using a random secret token for this run")
+
+    app = web.Application()
+    handler = BoundedRequestHandler(
+        dispatcher=dp, bot=bot, concurrency=WEBHOOK_CONCURRENCY, secret_token=secret_token
+    )
+    handler.register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=WEBAPP_HOST, port=WEBAPP_PORT)
+    await site.start()
+
+    await bot.set_webhook(
+        f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+        secret_token=secret_token,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    logging.info(f"Webhook server listening on {WEBAPP_HOST}:{WEBAPP_PORT}{WEBHOOK_PATH}")
+
+    try:
+        await stop_event.wait()
+    finally:
+        # Stop accepting requests first, Telegram will redeliver anything it could not send us
+        await site.stop()
+        logging.info("Draining in-flight updates...")
+        await handler.drain()
+        await runner.cleanup()